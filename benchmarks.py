@@ -0,0 +1,161 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+if "SDL_VIDEODRIVER" not in os.environ:
+    # Run headless, where only the software renderer is available.
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_RENDER_DRIVER"] = "software"
+
+# The kinds of labels a typical screen is full of: buttons, list rows, and headings.
+LABELS = [
+    "OK",
+    "Cancel",
+    "Save Changes",
+    "Settings",
+    "Sign in with your account",
+    "Today, 10:42 AM",
+    "Downloads (3)",
+    "Wi-Fi: Connected",
+] + ["Item #{} — Toggle to mark as done".format(i) for i in range(192)]
+
+
+def timed(func, repeat=20):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_labels():
+    from pyui.font import Font
+
+    Font.initialize(1.0)
+    font = Font("dejavu/DejaVuSans.ttf", 14)
+
+    def laid_out():
+        # The full layout path, without the measurement cache.
+        font.measured.clear()
+        for label in LABELS:
+            font.lines(label, 2**14)
+
+    def single_line():
+        for label in LABELS:
+            font.measure(label)
+
+    single_line()
+    slow = timed(laid_out)
+    fast = timed(single_line)
+    print(
+        "{} labels: layout {:.2f}ms, single line {:.2f}ms ({:.1f}x)".format(
+            len(LABELS), slow * 1000, fast * 1000, slow / fast
+        )
+    )
+
+
+def bench_icons():
+    import json
+
+    from pyui.icons import IconIndex
+    from pyui.views.text import DATA_DIR, Icon
+
+    names = list(Icon.index)
+
+    def parse():
+        with open(os.path.join(DATA_DIR, "icons.json")) as f:
+            return json.load(f)["icons"]
+
+    def load():
+        IconIndex(Icon.index.path).load()
+
+    icons = parse()
+    parsed = timed(parse)
+    loaded = timed(load)
+    print(
+        "icons: parse json {:.2f}ms, load index {:.3f}ms".format(
+            parsed * 1000, loaded * 1000
+        )
+    )
+    indexed = timed(lambda: [Icon.index[name] for name in names])
+    looked_up = timed(lambda: [icons[name] for name in names])
+    print(
+        "{} icon lookups: index {:.2f}ms ({:.1f}us each), dict {:.2f}ms".format(
+            len(names),
+            indexed * 1000,
+            indexed / len(names) * 1e6,
+            looked_up * 1000,
+        )
+    )
+
+
+def screen():
+    import pyui
+
+    return pyui.ScrollView()(
+        pyui.VStack(alignment=pyui.Alignment.LEADING)(
+            *(
+                pyui.HStack()(pyui.Text(label), pyui.Spacer(), pyui.Button("Edit"))
+                for label in LABELS[:40]
+            )
+        )
+    )
+
+
+def startup(lean):
+    """
+    Times importing pyui, starting an application, and drawing the first frame of a
+    window, which is only meaningful in a fresh interpreter, see bench_startup.
+    """
+    marks = [time.perf_counter()]
+    import pyui
+
+    marks.append(time.perf_counter())
+    # Loads SDL and the rest of pyui.
+    pyui.Application
+    marks.append(time.perf_counter())
+
+    async def first_frame():
+        app = pyui.Application("pyui.benchmarks", lean=lean)
+        marks.append(time.perf_counter())
+        app.window("Benchmark", screen)
+        app.startup()
+        app.tick(0)
+        marks.append(time.perf_counter())
+
+    asyncio.run(first_frame())
+    print(" ".join("{:.1f}".format((b - a) * 1000) for a, b in zip(marks, marks[1:])))
+
+
+def bench_startup(runs=5):
+    for lean in (False, True):
+        # The fastest of each step, over several runs.
+        best = None
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, __file__, "startup", "lean" if lean else "full"],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            marks = [float(ms) for ms in output.split()]
+            best = marks if best is None else list(map(min, best, marks))
+        print(
+            "{} startup: import pyui {}ms, load SDL {}ms, initialize {}ms, "
+            "first frame {}ms (total {:.1f}ms)".format(
+                "lean" if lean else "full", *best, sum(best)
+            )
+        )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["startup"]:
+        startup(lean=sys.argv[2:] == ["lean"])
+    else:
+        bench_labels()
+        bench_icons()
+        bench_startup()
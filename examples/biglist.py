@@ -0,0 +1,32 @@
+import pyui
+
+
+class BigList(pyui.View):
+    count = pyui.State(int, default=1000000)
+
+    def row(self, num):
+        code = "#{:06x}".format(num * 2654435761 % 0xFFFFFF)
+        return pyui.HStack(
+            pyui.Text("Row {}".format(num + 1)),
+            pyui.Spacer(),
+            pyui.Text(code).color(128, 128, 128),
+        ).padding(5, 10)
+
+    def content(self):
+        yield pyui.VStack(alignment=pyui.Alignment.LEADING)(
+            pyui.Text("{:,} rows".format(self.count.value)),
+            pyui.ScrollView()(
+                pyui.LazyVStack(
+                    range(self.count.value),
+                    self.row,
+                    alignment=pyui.Alignment.LEADING,
+                    spacing=0,
+                )
+            ).priority(pyui.Priority.HIGH),
+        ).padding(20)
+
+
+if __name__ == "__main__":
+    app = pyui.Application("io.temp.BigList")
+    app.window("Big List", BigList())
+    app.run()
@@ -28,7 +28,7 @@ class IconsView(pyui.View):
 
     def filtered_icons(self):
         search = self.search_text.value.lower()
-        for name in pyui.Icon.data["icons"]:
+        for name in pyui.Icon.index:
             if search == "" or search in name:
                 yield name
 
@@ -107,6 +107,7 @@ class TodoMVC(pyui.View):
                             .padding(0),
                         )
                     ),
+                    key=id,
                 ),
             ).priority(pyui.Priority.HIGH),
             pyui.HStack(
@@ -1,26 +1,41 @@
-from .animation import bezier, linear, parametric, quadratic, spring
-from .app import Application
-from .env import Environment
-from .geom import Alignment, Axis, Position, Priority
-from .state import Observable, State, mutating
-from .theme import Theme
-from .views import *  # noqa
+import importlib
+
 from .views import __all__ as all_views
 
-__all__ = [
-    "Alignment",
-    "Axis",
-    "Application",
-    "Environment",
-    "mutating",
-    "Observable",
-    "Position",
-    "Priority",
-    "State",
-    "Theme",
-]
-__all__ += ["bezier", "linear", "parametric", "quadratic", "spring"]
-__all__ += all_views
+# The module each name is defined in. Like views (see pyui.views), they are imported
+# when first used, so importing part of pyui doesn't load SDL and every view.
+EXPORTS = {
+    "Alignment": ".geom",
+    "Axis": ".geom",
+    "Application": ".app",
+    "Environment": ".env",
+    "mutating": ".state",
+    "Observable": ".state",
+    "Position": ".geom",
+    "Priority": ".geom",
+    "State": ".state",
+    "Theme": ".theme",
+    "bezier": ".animation",
+    "linear": ".animation",
+    "parametric": ".animation",
+    "quadratic": ".animation",
+    "spring": ".animation",
+}
+EXPORTS.update(dict.fromkeys(all_views, ".views"))
+
+__all__ = list(EXPORTS)
 
 __version__ = "0.1.0"
 __version_info__ = tuple(int(num) for num in __version__.split("."))
+
+
+def __getattr__(name):
+    if name not in EXPORTS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
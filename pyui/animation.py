@@ -75,3 +75,7 @@ class AnimationExecutor:
 
     def finished(self):
         return self.animation.finished(self.t)
+
+    def complete(self):
+        self.t = self.animation.duration + self.animation.delay
+        self.modifier(self.new_value.copy())
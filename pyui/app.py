@@ -1,4 +1,5 @@
 import asyncio
+import contextlib
 import ctypes
 import os
 import sys
@@ -9,6 +10,9 @@ from sdl2.sdlimage import IMG_INIT_PNG, IMG_Init
 from .env import Environment
 from .font import Font
 from .geom import Insets, Point, Rect, Size
+from .layers import LayerCache
+from .spatial import SpatialIndex
+from .views import View
 
 
 class Settings:
@@ -17,6 +21,9 @@ class Settings:
 
 
 class Window:
+    # View attributes that hit testing can filter on without walking the hierarchy.
+    indexed = ("interactive", "scrollable")
+
     def __init__(
         self,
         app,
@@ -32,6 +39,22 @@ class Window:
         self.pack = pack
         self.needs_layout = True
         self.needs_render = True
+        # Areas to redraw on the next tick, when the whole window doesn't need to be.
+        self.damaged = []
+        # Everything is drawn to this texture, so that undamaged areas are kept between
+        # frames. Created on the first render, and whenever the window changes size.
+        self.target = None
+        self.target_size = None
+        # Views whose content changed, to be laid out again on the next tick.
+        self.dirty = []
+        # Views whose state changed, to be rebuilt (once each) on the next tick.
+        self.changed = {}
+        # How many batch() blocks are currently open.
+        self.batching = 0
+        # Spatial index of the view hierarchy for hit testing, rebuilt lazily after any
+        # views move (i.e. when View.placements changes).
+        self.spatial = None
+        self.spatial_placements = None
         flags = sdl2.SDL_WINDOW_ALLOW_HIGHDPI
         if resize:
             flags |= sdl2.SDL_WINDOW_RESIZABLE
@@ -41,17 +64,38 @@ class Window:
             title.encode("utf-8"),
             sdl2.SDL_WINDOWPOS_CENTERED,
             sdl2.SDL_WINDOWPOS_CENTERED,
-            int(width * app.win_scale),
-            int(height * app.win_scale),
+            int(width * (app.win_scale or 1.0)),
+            int(height * (app.win_scale or 1.0)),
             flags,
         )
         self.id = sdl2.SDL_GetWindowID(self.win)
         self.renderer = sdl2.SDL_CreateRenderer(
             self.win, -1, sdl2.SDL_RENDERER_ACCELERATED
         )
+        if app.win_scale is None:
+            # The first window of a lean application, see Application.
+            app.measure_scale(self.win, self.renderer, int(width))
+            if app.win_scale != 1.0:
+                sdl2.SDL_SetWindowSize(
+                    self.win, int(width * app.win_scale), int(height * app.win_scale)
+                )
+        if not isinstance(view, View):
+            view = view()
+        # Only redraw damaged areas when the renderer clips exactly. The software
+        # renderer resamples scaled textures when clipping them, leaving seams.
+        info = sdl2.SDL_RendererInfo()
+        sdl2.SDL_GetRendererInfo(self.renderer, ctypes.byref(info))
+        self.partial_redraw = bool(info.flags & sdl2.SDL_RENDERER_ACCELERATED)
         self.view = view
         self.view._window = self
-        self.view.env.theme.prepare(self.renderer)
+        # Every view in the hierarchy by id_path, see register() and resolve().
+        self.views = {view.id_path: view}
+        # Cached result of focus_chain(), reset when the hierarchy changes.
+        self.chain = None
+        # Textures for rasterized views.
+        self.layers = LayerCache(self.renderer)
+        # Loads the theme's fonts in the background, see startup().
+        self.preparing = None
         self.hover = None
         self.menu = None
         self.background = self.view.env.theme.config["background"]
@@ -84,6 +128,7 @@ class Window:
         self.app.listen(
             sdl2.SDL_TEXTINPUT, "text", self.text_event, check=self.check_window
         )
+        self.app.listen(sdl2.SDL_RENDER_TARGETS_RESET, "common", self.targets_reset)
 
     def check_window(self, event):
         return event.windowID == self.id
@@ -102,14 +147,37 @@ class Window:
         sdl2.SDL_GetRendererOutputSize(self.renderer, ctypes.byref(w), ctypes.byref(h))
         return Size(w.value, h.value)
 
+    def focus_chain(self):
+        """
+        Returns the interactive views in focus order, and a dict of their positions in
+        it. This is only recomputed after views are added, removed, or reordered.
+        """
+        if self.chain is None:
+            views = self.view.find_all(interactive=True)
+            self.chain = (views, {view: idx for idx, view in enumerate(views)})
+        return self.chain
+
     def advance_focus(self, by=1):
-        chain = self.view.find_all(interactive=True, disabled=False)
-        current = self.view.resolve(self.focus)
-        try:
-            idx = (chain.index(current) + by) % len(chain)
-        except ValueError:
-            idx = by - 1 if by > 0 else by
-        self.focus = chain[idx].id_path
+        chain, positions = self.focus_chain()
+        current = self.resolve(self.focus)
+        idx = positions.get(current)
+        if idx is None or current.disabled:
+            # Start from the first (or last, going backwards) view.
+            idx = -1 if by > 0 else len(chain)
+        step = 1 if by > 0 else -1
+        count = abs(by)
+        # Skip over disabled views, wrapping around the chain.
+        for _ in range(count * len(chain)):
+            idx = (idx + step) % len(chain)
+            if not chain[idx].disabled:
+                count -= 1
+                if not count:
+                    self.focus = chain[idx].id_path
+                    # Both draw differently now, even inside a rasterized layer.
+                    for view in (current, chain[idx]):
+                        if view is not None:
+                            self.refresh(view)
+                    return
 
     def resize(self, width, height):
         sdl2.SDL_SetWindowSize(self.win, int(width), int(height))
@@ -122,16 +190,96 @@ class Window:
         return Point(int(x * xs), int(y * ys))
 
     def layout(self, force=False):
-        if not self.needs_layout and not force:
-            return
-        self.needs_layout = False
-        self.animations = []
-        self.view.layout(Rect(size=self.render_size))
+        if self.needs_layout or force:
+            self.needs_layout = False
+            self.dirty = []
+            # Views reuse their previous layout when possible, so make sure none are
+            # left in the middle of an animation.
+            for a in self.animations:
+                a.complete()
+            self.animations = []
+            self.view.layout(Rect(size=self.render_size))
+        elif self.dirty:
+            dirty = set(self.dirty)
+            self.dirty = []
+            for view in dirty:
+                # Skip views that were removed, or will be laid out with an ancestor.
+                parent = view.parent
+                while parent and parent not in dirty:
+                    parent = parent.parent
+                if parent is None and view.root in (self.view, self.menu):
+                    self.relayout(view)
+
+    def invalidate(self, view):
+        """
+        Schedules a view whose content changed to be laid out on the next tick.
+        """
+        self.dirty.append(view)
+
+    def state_changed(self, view):
+        self.changed[view] = True
+
+    def flush(self):
+        """
+        Rebuilds any views whose state changed since the last flush. Each view is only
+        rebuilt once, and not at all if it will be rebuilt along with an ancestor.
+        """
+        while self.changed:
+            changed = self.changed
+            self.changed = {}
+            for view in changed:
+                parent = view.parent
+                while parent and parent not in changed:
+                    parent = parent.parent
+                if parent is None and view.root is self.view:
+                    view.handle_state_change()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Holds any state changes until the end of the (outermost) block, then rebuilds
+        and lays out the changed views all at once. State changes are already deferred
+        until the next tick, so this is mostly useful outside of the event loop, or for
+        changes made across await points.
+        """
+        self.batching += 1
+        try:
+            yield self
+        finally:
+            self.batching -= 1
+        if not self.batching:
+            self.flush()
+            self.layout()
+
+    def relayout(self, view):
+        """
+        Lays out a view again using the space it was last offered. If that changes its
+        size or minimum size, its parent needs to be laid out too, and so on up the
+        hierarchy until reaching a view whose size is stable. That view is then
+        repositioned where it was, along with everything inside it.
+        """
+        while True:
+            if view._offer is not None:
+                size = view.frame.size
+                minimum = view._minimum
+                view.fit(view._offer)
+                stable = view.frame.size == size and minimum in (None, view.measure())
+                if stable or view.parent is None:
+                    view.place(view._inside)
+                    return
+            elif view.parent is None:
+                self.layout(force=True)
+                return
+            view = view.parent
 
     def bounce_state_change(self, view):
         view.handle_state_change()
 
     def startup(self):
+        # Load the theme's fonts in the background, so the window can be shown first.
+        self.preparing = asyncio.create_task(
+            self.view.env.theme.prepare_async(self.renderer)
+        )
         self.layout()
         if self.pack:
             scale = self.window_size.w / self.render_size.w
@@ -145,58 +293,167 @@ class Window:
         # and starts animating.
         self.needs_render = False
 
+    def damage(self, rect):
+        """
+        Schedules an area of the window to be redrawn on the next tick.
+        """
+        self.damaged.append(rect.copy())
+
+    def refresh(self, view):
+        """
+        Schedules a view that handled an event to be redrawn, along with any focus ring
+        drawn just outside it, and any rasterized layers it is part of.
+        """
+        if view.draws_focus:
+            self.damage(view.frame + Insets(view.env.scaled(1)))
+        else:
+            self.damage(view.frame)
+        self.layers.stale(view)
+
+    def prepare_target(self):
+        """
+        Makes sure the render target texture exists and is the right size. Returns False
+        if it had to be (re-)created, meaning its contents need to be drawn in full.
+        """
+        size = self.render_size
+        if self.target is not None and self.target_size == size:
+            return True
+        if self.target is not None:
+            sdl2.SDL_DestroyTexture(self.target)
+        # Use the same format as the window, so blending gives identical results.
+        self.target = sdl2.SDL_CreateTexture(
+            self.renderer,
+            sdl2.SDL_GetWindowPixelFormat(self.win),
+            sdl2.SDL_TEXTUREACCESS_TARGET,
+            size.w,
+            size.h,
+        )
+        self.target_size = size
+        if not self.target:
+            # Fall back to drawing everything directly to the window.
+            self.target = None
+            self.partial_redraw = False
+        return False
+
     def render(self, force=False):
-        if not self.needs_render and not force:
+        if not self.needs_render and not self.damaged and not force:
             return
+        damaged = None
+        if self.partial_redraw and self.prepare_target():
+            if not self.needs_render and not force:
+                damaged = self.damaged[0]
+                for rect in self.damaged[1:]:
+                    damaged = damaged.union(rect)
+                damaged = damaged.intersection(Rect(size=self.target_size))
+                if damaged is None:
+                    self.damaged = []
+                    return
         # Set this up front, so that the act of rendering can request another render.
         self.needs_render = False
+        self.damaged = []
+        if self.target is not None:
+            sdl2.SDL_SetRenderTarget(self.renderer, self.target)
         sdl2.SDL_SetRenderDrawColor(
             self.renderer, *self.background, sdl2.SDL_ALPHA_OPAQUE
         )
-        sdl2.SDL_RenderClear(self.renderer)
-        self.view.render(self.renderer)
-        focus_view = self.view.resolve(self.focus)
-        if focus_view and focus_view.draws_focus:
-            focus_rect = focus_view.frame + Insets(focus_view.env.scaled(1))
-            self.view.env.draw(self.renderer, "focus", focus_rect)
-        if self.menu:
-            self.menu.render(self.renderer)
+        if damaged is None:
+            sdl2.SDL_RenderClear(self.renderer)
+        else:
+            sdl2.SDL_RenderSetClipRect(self.renderer, ctypes.byref(damaged.sdl))
+            # Replace what was there, whatever blend mode was last used for drawing.
+            sdl2.SDL_SetRenderDrawBlendMode(self.renderer, sdl2.SDL_BLENDMODE_NONE)
+            sdl2.SDL_RenderFillRect(self.renderer, ctypes.byref(damaged.sdl))
+        View.damaged = damaged
+        try:
+            self.view.render(self.renderer)
+            focus_view = self.resolve(self.focus)
+            if focus_view and focus_view.draws_focus:
+                focus_rect = focus_view.frame + Insets(focus_view.env.scaled(1))
+                if damaged is None or damaged.intersects(focus_rect):
+                    self.view.env.draw(self.renderer, "focus", focus_rect)
+            if self.menu:
+                self.menu.render(self.renderer)
+        finally:
+            View.damaged = None
+        if self.target is not None:
+            sdl2.SDL_SetRenderTarget(self.renderer, None)
+            sdl2.SDL_RenderSetClipRect(
+                self.renderer, ctypes.byref(Rect(size=self.target_size).sdl)
+            )
+            sdl2.SDL_RenderCopy(self.renderer, self.target, None, None)
         sdl2.SDL_RenderPresent(self.renderer)
 
     def tick(self, dt):
         for a in self.animations:
             a.step(dt)
         self.animations = [a for a in self.animations if not a.finished()]
+        if not self.batching:
+            self.flush()
         self.layout()
         self.render()
 
     def cleanup(self):
+        if self.preparing is not None:
+            self.preparing.cancel()
+        self.layers.clear()
+        if self.target is not None:
+            sdl2.SDL_DestroyTexture(self.target)
+        Font.release_renderer(self.renderer)
         sdl2.SDL_DestroyRenderer(self.renderer)
         sdl2.SDL_DestroyWindow(self.win)
 
     def show_menu(self, menu, pt):
         self.menu = menu
         self.menu.rebuild()
-        self.menu.resize(self.render_size)
-        self.menu.reposition(Rect(origin=pt, size=self.menu.frame.size))
+        self.menu.fit(self.render_size)
+        self.menu.place(Rect(origin=pt, size=self.menu.frame.size))
 
     def find(self, pt, **filters):
-        for view in (self.menu, self.view):
-            if view is None:
-                continue
-            found = view.find(pt, **filters)
+        if self.menu is not None:
+            found = self.menu.find(pt, **filters)
             if found:
                 return found
-        return None
+        attr = None
+        if filters:
+            attr, value = next(iter(filters.items()))
+            if len(filters) > 1 or attr not in self.indexed or value is not True:
+                return self.view.find(pt, **filters)
+        return self.spatial_index().find(pt, attr)
+
+    def spatial_index(self):
+        if self.spatial is None or self.spatial_placements != View.placements:
+            self.spatial = SpatialIndex(self.view, self.indexed)
+            self.spatial_placements = View.placements
+        return self.spatial
 
     def resolve(self, path):
-        for view in (self.menu, self.view):
-            if view is None:
-                continue
-            found = view.resolve(path)
+        if self.menu is not None:
+            found = self.menu.resolve(path)
             if found:
                 return found
-        return None
+        return self.views.get(path)
+
+    def register(self, view):
+        """
+        Adds a view to the registry, as long as it's still attached to this window.
+        """
+        if view.root is not self.view:
+            return
+        if self.views.get(view.id_path) is not view:
+            self.views[view.id_path] = view
+            self.chain = None
+
+    def unregister(self, view):
+        """
+        Removes a view and everything inside it from the registry, unless it has already
+        been replaced by another view with the same id_path.
+        """
+        if self.views.get(view.id_path) is view:
+            del self.views[view.id_path]
+            self.chain = None
+        self.layers.discard(view)
+        for subview in view.subviews:
+            self.unregister(subview)
 
     # Event handlers
 
@@ -206,25 +463,36 @@ class Window:
         if found is None or found.disabled:
             found = self.view
         await found.mousedown(pt)
+        self.refresh(found)
         self.tracking = found.id_path
-        self.needs_render = True
 
     async def mousemotion(self, event):
         pt = self.point(event.x, event.y)
         current_hover = self.resolve(self.hover)
+        found = self.find(pt)
+        # Only redraw the views whose hovering state changes, unless something is being
+        # dragged.
+        hovering = {}
+        for view in (current_hover, found):
+            while view is not None:
+                hovering[view] = view.hovering
+                view = view.parent
         if current_hover:
             await current_hover.hover(pt)
-        found = self.find(pt)
         if found:
             self.hover = found.id_path
             if found != current_hover:
                 await found.hover(pt)
         else:
             self.hover = None
+        for view, was_hovering in hovering.items():
+            if view.hovering != was_hovering:
+                self.damage(view.frame)
+                self.layers.stale(view)
         tracking_view = self.resolve(self.tracking)
         if tracking_view:
             await tracking_view.mousemotion(pt)
-        self.needs_render = True
+            self.refresh(tracking_view)
 
     async def mouseup(self, event):
         pt = self.point(event.x, event.y)
@@ -233,16 +501,24 @@ class Window:
         if focus_view and not found:
             self.focus = None
             await focus_view.blur()
+            self.refresh(focus_view)
         tracking_view = self.resolve(self.tracking)
+        menu = self.menu
         self.menu = None
         if tracking_view:
             await tracking_view.mouseup(pt)
+            self.refresh(tracking_view)
             if tracking_view == found:
+                if focus_view and focus_view is not found:
+                    self.refresh(focus_view)
                 self.focus = found.id_path
                 await found.focus()
                 await found.click(pt)
         self.tracking = None
-        self.needs_render = True
+        # Redraw where a menu was closed, or a new one was shown (by the click).
+        for shown in (menu, self.menu):
+            if shown is not None:
+                self.damage(shown.frame)
 
     async def mousewheel(self, event):
         x = ctypes.c_int()
@@ -253,7 +529,7 @@ class Window:
         if found is None or found.disabled:
             found = self.view
         await found.mousewheel(Point(-event.x, event.y))
-        self.needs_render = True
+        self.refresh(found)
 
     def window_event(self, event):
         # Note that this is not async because the loop is blocked during resizing.
@@ -261,6 +537,11 @@ class Window:
             self.layout(force=True)
             self.render(force=True)
 
+    def targets_reset(self, event):
+        # The contents of the render targets were lost, so everything must be redrawn.
+        self.layers.reset()
+        self.needs_render = True
+
     async def key_event(self, event):
         focus_view = self.resolve(self.focus)
         if focus_view is None or focus_view.disabled:
@@ -276,14 +557,14 @@ class Window:
             await focus_view.keydown(event.keysym.sym, event.keysym.mod)
         elif event.type == sdl2.SDL_KEYUP:
             await focus_view.keyup(event.keysym.sym, event.keysym.mod)
-        self.needs_render = True
+        self.refresh(focus_view)
 
     async def text_event(self, event):
         focus_view = self.resolve(self.focus)
         if focus_view is None or focus_view.disabled:
             focus_view = self.view
         await focus_view.textinput(event.text.decode("utf-8"))
-        self.needs_render = True
+        self.refresh(focus_view)
 
 
 class EventListener:
@@ -302,7 +583,15 @@ class EventListener:
 
 
 class Application:
-    def __init__(self, app_id, settings=Settings):
+    """
+    If lean is set, only SDL's video and event subsystems are started, and the
+    resolution scaling factor is worked out from the first window instead of a probe
+    window. Since views use the scale when they're built, give window() a view class
+    (or a function returning a view) to build it once the scale is known.
+    """
+
+    def __init__(self, app_id, settings=Settings, lean=False):
+        self.lean = lean
         self.initialize()
         self.settings = settings(app_id)
         self.windows = []
@@ -313,8 +602,12 @@ class Application:
     def initialize(self):
         if os.name == "nt":
             ctypes.windll.shcore.SetProcessDpiAwareness(1)
-        sdl2.SDL_Init(sdl2.SDL_INIT_EVERYTHING)
+        sdl2.SDL_Init(sdl2.SDL_INIT_VIDEO if self.lean else sdl2.SDL_INIT_EVERYTHING)
         IMG_Init(IMG_INIT_PNG)
+        if self.lean:
+            # Worked out when the first window is created, see Window.
+            self.win_scale = None
+            return
         # Ugly hack to determine resolution scaling factor as early as possible.
         win = sdl2.SDL_CreateWindow(
             "ResolutionTest".encode("utf-8"),
@@ -325,16 +618,23 @@ class Application:
             sdl2.SDL_WINDOW_HIDDEN | sdl2.SDL_WINDOW_ALLOW_HIGHDPI,
         )
         rend = sdl2.SDL_CreateRenderer(win, -1, sdl2.SDL_RENDERER_ACCELERATED)
+        self.measure_scale(win, rend, 100)
+        sdl2.SDL_DestroyRenderer(rend)
+        sdl2.SDL_DestroyWindow(win)
+
+    def measure_scale(self, win, renderer, width):
+        """
+        Works out the resolution scaling factors from a window that was created width
+        pixels wide (unscaled), and its renderer.
+        """
         win_w = ctypes.c_int()
         rend_w = ctypes.c_int()
         sdl2.SDL_GetWindowSize(win, ctypes.byref(win_w), None)
-        sdl2.SDL_GetRendererOutputSize(rend, ctypes.byref(rend_w), None)
+        sdl2.SDL_GetRendererOutputSize(renderer, ctypes.byref(rend_w), None)
         # Windows HiDPI is silly like this. You get back different window sizes than you
         # put in.
-        self.win_scale = win_w.value / 100.0
-        Environment.scale.default = rend_w.value / 100.0
-        sdl2.SDL_DestroyRenderer(rend)
-        sdl2.SDL_DestroyWindow(win)
+        self.win_scale = win_w.value / width
+        Environment.scale.default = rend_w.value / width
         # Initialize our font cache and calculate DPI scaling.
         Font.initialize()
 
@@ -1,30 +1,170 @@
+import asyncio
+import bisect
+import collections
 import ctypes
+import itertools
 import math
+import operator
 import os
+import re
+import struct
+import threading
 import unicodedata
+import weakref
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 
 import sdl2
 from sdl2.sdlttf import (
     TTF_HINTING_LIGHT,
     TTF_CloseFont,
     TTF_FontLineSkip,
+    TTF_GetFontKerning,
     TTF_GetFontKerningSizeGlyphs,
     TTF_Init,
     TTF_OpenFont,
-    TTF_RenderGlyph_Blended,
+    TTF_RenderGlyph32_Blended,
     TTF_SetFontHinting,
+    TTF_SizeUTF8,
 )
 
-from .geom import Rect, Size
-from .utils import enumerate_last
+from .geom import Size
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
+# SDL_RenderGeometry was added in SDL 2.0.18.
+_version = sdl2.SDL_version()
+sdl2.SDL_GetVersion(ctypes.byref(_version))
+HAS_GEOMETRY = (_version.major, _version.minor, _version.patch) >= (2, 0, 18)
+
+# The layout of an SDL_Vertex: position (x, y), color (r, g, b, a), tex_coord (u, v).
+VERTEX = "2f4B2f"
+
+# The printable ASCII characters, which fonts load ahead of time, see Font.prepare.
+PRINTABLE = range(32, 127)
+
+# Runs of unprintable characters, other than newlines.
+UNPRINTABLE = re.compile(r"[\x00-\x09\x0b-\x1f]+")
+
+# Splits text into the pieces Font.words breaks it at, see segmenter().
+SEGMENTS = None
+
+
+def segmenter():
+    """
+    Returns a pattern matching newlines, unprintable characters, spaces, and runs of
+    other characters either ending in punctuation ("punct") or not ("word"). Finding
+    the punctuation takes a while, so the pattern is compiled the first time it's
+    needed. Only the BMP is searched; characters beyond it are matched one at a time
+    ("astral"), to be checked separately.
+    """
+    global SEGMENTS
+    if SEGMENTS is None:
+        ranges = []
+        for code in range(0x10000):
+            if unicodedata.category(chr(code)).startswith("P"):
+                if ranges and ranges[-1][1] == code - 1:
+                    ranges[-1][1] = code
+                else:
+                    ranges.append([code, code])
+        punct = "".join(r"\u{:04x}-\u{:04x}".format(a, b) for a, b in ranges)
+        other = r"[^\x00-\x20{}\U00010000-\U0010ffff]".format(punct)
+        SEGMENTS = re.compile(
+            r"(?P<newline>\n)|(?P<control>[\x00-\x1f])|(?P<space> )"
+            r"|(?P<punct>{other}*[{punct}])|(?P<word>{other}+)|(?P<astral>.)".format(
+                other=other, punct=punct
+            ),
+            re.DOTALL,
+        )
+    return SEGMENTS
+
+
+class GlyphAtlas:
+    """
+    A texture that glyphs are packed into, left to right in rows ("shelves") as tall as
+    the tallest glyph in them, so text can be drawn from a single texture.
+    """
+
+    # Space between glyphs, so they don't bleed into each other when scaled.
+    padding = 1
+
+    def __init__(self, renderer, width=512, height=512):
+        self.width = width
+        self.height = height
+        self.bytes = width * height * 4
+        # The renderer the texture belongs to, and the glyphs (keyed as in Font.glyphs)
+        # that have been added.
+        self.renderer = ctypes.addressof(renderer.contents)
+        self.keys = []
+        self.texture = sdl2.SDL_CreateTexture(
+            renderer,
+            sdl2.SDL_PIXELFORMAT_ARGB8888,
+            sdl2.SDL_TEXTUREACCESS_STATIC,
+            width,
+            height,
+        )
+        sdl2.SDL_SetTextureBlendMode(self.texture, sdl2.SDL_BLENDMODE_BLEND)
+        # Only draw glyphs as geometry when the renderer maps texture coordinates
+        # exactly. The software renderer interpolates them in fixed point, which can
+        # stretch a glyph by a row or column of pixels.
+        info = sdl2.SDL_RendererInfo()
+        sdl2.SDL_GetRendererInfo(renderer, ctypes.byref(info))
+        self.batched = HAS_GEOMETRY and bool(info.flags & sdl2.SDL_RENDERER_ACCELERATED)
+        # Textures start out with undefined contents.
+        blank = ctypes.create_string_buffer(width * height * 4)
+        sdl2.SDL_UpdateTexture(self.texture, None, blank, width * 4)
+        self.x = 0
+        self.y = 0
+        self.shelf = 0
+
+    def add(self, surface):
+        """
+        Copies the surface into the atlas, returning where it was put, or None if there
+        is no room left.
+        """
+        w = surface.contents.w
+        h = surface.contents.h
+        if self.x + w > self.width:
+            self.x = 0
+            self.y += self.shelf + self.padding
+            self.shelf = 0
+        if self.x + w > self.width or self.y + h > self.height:
+            return None
+        rect = sdl2.SDL_Rect(self.x, self.y, w, h)
+        if w and h:
+            sdl2.SDL_UpdateTexture(
+                self.texture,
+                ctypes.byref(rect),
+                surface.contents.pixels,
+                surface.contents.pitch,
+            )
+        self.x += w + self.padding
+        self.shelf = max(self.shelf, h)
+        return rect
+
+    def destroy(self):
+        sdl2.SDL_DestroyTexture(self.texture)
+
 
 class Font:
-    cache = {}
+    # Loaded fonts, least recently used first, see load().
+    cache = collections.OrderedDict()
+    # The fonts that have loaded glyphs for each renderer (by address), including any
+    # evicted from the cache that are still in use, see release_renderer().
+    renderers = {}
+    # How many bytes of glyphs all the loaded fonts may keep, before the least recently
+    # used fonts are evicted from the cache.
+    budget = 256 * 1024 * 1024
+    # How many bytes of glyphs each font may keep, before the least recently used are
+    # freed, see trim().
+    glyph_budget = 32 * 1024 * 1024
+    # How many characters of measured text each font keeps laid out, see lines().
+    measure_limit = 65536
     scale = 1.0
     search = [os.path.join(BASE_DIR, "fonts")]
+    # Renders glyphs in the background (ctypes releases the GIL while SDL_ttf works),
+    # created when first needed, see pool().
+    executor = None
 
     @classmethod
     def initialize(cls, scale=None, search=None):
@@ -40,13 +180,57 @@ class Font:
     @classmethod
     def load(cls, path, size, search=None):
         key = "{}-{}".format(path, size)
-        if key not in cls.cache:
+        if key in cls.cache:
+            cls.cache.move_to_end(key)
+        else:
             cls.cache[key] = cls(path, size, search=search)
+            cls.evict()
         return cls.cache[key]
 
+    @classmethod
+    def evict(cls):
+        """
+        Evicts the least recently used fonts (other than the most recent) from the
+        cache, freeing their glyphs, until the rest are within the budget.
+        """
+        total = sum(font.memory for font in cls.cache.values())
+        while total > cls.budget and len(cls.cache) > 1:
+            key, font = cls.cache.popitem(last=False)
+            total -= font.memory
+            font.release()
+
+    @classmethod
+    def usage(cls):
+        """
+        Returns how many bytes of glyphs each loaded font is keeping, by cache key.
+        """
+        return {key: font.memory for key, font in cls.cache.items()}
+
+    @classmethod
+    def release_renderer(cls, renderer):
+        """
+        Frees any glyphs loaded for a renderer, which should be called before
+        destroying it.
+        """
+        address = ctypes.addressof(renderer.contents)
+        for font in list(cls.renderers.pop(address, ())):
+            for atlas in list(font.atlases.get(address, ())):
+                font.discard(atlas)
+
+    @classmethod
+    def pool(cls):
+        if cls.executor is None:
+            cls.executor = ThreadPoolExecutor(thread_name_prefix="pyui-font")
+        return cls.executor
+
     @classmethod
     def cleanup(cls):
-        cls.cache = {}
+        for font in cls.cache.values():
+            font.release()
+        cls.cache = collections.OrderedDict()
+        if cls.executor is not None:
+            cls.executor.shutdown()
+            cls.executor = None
 
     def __init__(self, path, size, search=None):
         self.path = path
@@ -56,11 +240,32 @@ class Font:
             raise Exception("Could not load font: {}".format(path))
         TTF_SetFontHinting(self.font, TTF_HINTING_LIGHT)
         self.line_height = TTF_FontLineSkip(self.font)
-        # A cache of surfaces that have been loaded for measuring, but not yet loaded
-        # into a texture.
-        self.surfaces = {}
-        # A cache of loaded textures and sizes per glyph.
+        # FreeType faces can't be used by more than one thread at a time, so any
+        # SDL_ttf calls that may happen while glyphs are rendering in the background
+        # hold this.
+        self.lock = threading.Lock()
+        # Glyphs being rendered in the background, by code point, see rasterize().
+        self.rendering = {}
+        # The atlas, source rect, and size of each glyph that has been loaded, keyed by
+        # renderer and glyph, since textures can only be used by their own renderer.
         self.glyphs = {}
+        # Atlases glyphs have been loaded into per renderer, the last one being filled.
+        self.atlases = {}
+        # Every atlas, least recently drawn from first.
+        self.recent = collections.OrderedDict()
+        self.atlas_bytes = 0
+        # The widths of glyphs that have been measured, from their metrics.
+        self.widths = {}
+        # A cache of kerning between pairs of glyphs, keyed by (prev << 32 | code).
+        self.kerns = {}
+        # Cleared if the font has no kerning, so pairs don't need to be looked up.
+        self.kerned = bool(TTF_GetFontKerning(self.font))
+        # The size and lines of recently measured text, least recently used first,
+        # and how often it was (or wasn't) found there.
+        self.measured = collections.OrderedDict()
+        self.measured_chars = 0
+        self.hits = 0
+        self.misses = 0
 
     def load_font(self, path, size, search=None):
         if path.startswith("/") and os.path.exists(path):
@@ -75,100 +280,243 @@ class Font:
                 )
 
     def __del__(self):
+        self.release()
         TTF_CloseFont(self.font)
-        for surface, size in self.surfaces.values():
-            sdl2.SDL_FreeSurface(surface)
-        for tex, size in self.glyphs.values():
-            sdl2.SDL_DestroyTexture(tex)
+
+    @property
+    def memory(self):
+        """
+        How many bytes of glyph atlases this font is keeping.
+        """
+        return self.atlas_bytes
+
+    def discard(self, atlas):
+        """
+        Frees an atlas, and forgets the glyphs that were loaded into it.
+        """
+        for key in atlas.keys:
+            del self.glyphs[key]
+        self.atlases[atlas.renderer].remove(atlas)
+        del self.recent[atlas]
+        self.atlas_bytes -= atlas.bytes
+        atlas.destroy()
+
+    def trim(self):
+        """
+        Frees the least recently drawn atlases, until this font is within its glyph
+        budget.
+        """
+        while self.recent and self.memory > self.glyph_budget:
+            self.discard(next(iter(self.recent)))
+
+    def release(self):
+        """
+        Frees all the glyphs this font has loaded. The font can still be used, and
+        will load glyphs again as needed.
+        """
+        for atlas in list(self.recent):
+            self.discard(atlas)
+        for future in self.rendering.values():
+            surface = future.result()
+            if surface:
+                sdl2.SDL_FreeSurface(surface)
+        self.rendering = {}
 
     def glyph_size(self, ch):
         assert isinstance(ch, int)
-        if ch in self.glyphs:
-            return self.glyphs[ch][1]
-        elif ch not in self.surfaces:
-            surface = TTF_RenderGlyph_Blended(
+        # Measured from the glyph's metrics, the same size rendering it would produce,
+        # but without rasterizing it.
+        w = ctypes.c_int()
+        h = ctypes.c_int()
+        with self.lock:
+            TTF_SizeUTF8(
+                self.font,
+                chr(ch).encode("utf-8", "surrogatepass"),
+                ctypes.byref(w),
+                ctypes.byref(h),
+            )
+        return Size(w.value, h.value)
+
+    def render_glyph(self, ch):
+        with self.lock:
+            return TTF_RenderGlyph32_Blended(
                 self.font, ch, sdl2.SDL_Color(255, 255, 255)
             )
-            self.surfaces[ch] = (surface, Size(surface.contents.w, surface.contents.h))
-        return self.surfaces[ch][1]
+
+    def rasterize(self, codes):
+        """
+        Starts rendering glyphs in the background, to be loaded into an atlas by glyph()
+        on the render thread. Returns the futures of the rendered surfaces. The font's
+        lock means its glyphs are still rendered one at a time, but alongside the event
+        loop and other fonts.
+        """
+        futures = []
+        for code in codes:
+            if code not in self.rendering:
+                self.rendering[code] = self.pool().submit(self.render_glyph, code)
+            futures.append(self.rendering[code])
+        return futures
 
     def glyph(self, renderer, ch):
+        """
+        Returns the atlas, source rect, and size of a glyph, loading it into an atlas
+        if it hasn't been already.
+        """
         assert isinstance(ch, int)
-        if ch not in self.glyphs:
-            # Pop the surface out of the cache and load it into a texture and the glyph
-            # cache.
-            surface, size = self.surfaces.pop(ch, (None, None))
-            if surface is None:
-                surface = TTF_RenderGlyph_Blended(
-                    self.font, ch, sdl2.SDL_Color(255, 255, 255)
+        key = (ctypes.addressof(renderer.contents), ch)
+        if key not in self.glyphs:
+            # Render the glyph (unless it already was in the background), and load it
+            # into an atlas and the glyph cache.
+            future = self.rendering.pop(ch, None)
+            surface = future.result() if future else self.render_glyph(ch)
+            if not surface:
+                # Nothing to render, e.g. a combining character.
+                self.glyphs[key] = (None, None, Size(0, 0))
+                return self.glyphs[key]
+            size = Size(surface.contents.w, surface.contents.h)
+            atlases = self.atlases.setdefault(key[0], [])
+            rect = atlases[-1].add(surface) if atlases else None
+            if rect is None:
+                # Start a new atlas, making sure it's big enough for this glyph.
+                atlas = GlyphAtlas(
+                    renderer,
+                    max(512, size.w + GlyphAtlas.padding),
+                    max(512, size.h + GlyphAtlas.padding),
                 )
-                size = Size(surface.contents.w, surface.contents.h)
-            self.glyphs[ch] = (
-                sdl2.SDL_CreateTextureFromSurface(renderer, surface),
-                size,
-            )
+                atlases.append(atlas)
+                Font.renderers.setdefault(key[0], weakref.WeakSet()).add(self)
+                self.recent[atlas] = None
+                self.atlas_bytes += atlas.bytes
+                rect = atlas.add(surface)
+            atlases[-1].keys.append(key)
+            self.glyphs[key] = (atlases[-1], rect, size)
             sdl2.SDL_FreeSurface(surface)
-        return self.glyphs[ch]
+        return self.glyphs[key]
+
+    def kern(self, prev, code):
+        pair = prev << 32 | code
+        if pair not in self.kerns:
+            if prev < 32 or code < 32:
+                # Nothing kerns with unprintable characters (or the start of text).
+                self.kerns[pair] = 0
+            else:
+                with self.lock:
+                    kern = TTF_GetFontKerningSizeGlyphs(self.font, prev, code)
+                self.kerns[pair] = kern
+        return self.kerns[pair]
+
+    def metrics(self, text, kerning=True):
+        """
+        Returns the code points of text, their widths, and the kerning before each of
+        them, computed all at once. Unprintable characters have no width, and are kerned
+        over (except newlines).
+        """
+        codes = list(map(ord, text))
+        widths = self.widths
+        try:
+            sizes = list(map(widths.__getitem__, codes))
+        except KeyError:
+            for code in codes:
+                if code not in widths:
+                    widths[code] = self.glyph_size(code).w if code >= 32 else 0
+            sizes = list(map(widths.__getitem__, codes))
+        if not (kerning and self.kerned):
+            return codes, sizes, [0] * len(codes)
+        prevs = [0] + codes[:-1]
+        for match in UNPRINTABLE.finditer(text):
+            start, end = match.span()
+            if end < len(codes):
+                prevs[end] = prevs[start]
+        pairs = list(
+            map(operator.or_, map(operator.lshift, prevs, itertools.repeat(32)), codes)
+        )
+        try:
+            kerns = list(map(self.kerns.__getitem__, pairs))
+        except KeyError:
+            kerns = [self.kern(pair >> 32, pair & 0xFFFFFFFF) for pair in pairs]
+        return codes, sizes, kerns
+
+    def kerning_pairs(self):
+        """
+        Looks up the kerning between every pair of printable ASCII characters, which
+        may be done in the background.
+        """
+        pairs = {}
+        for prev in PRINTABLE:
+            with self.lock:
+                for code in PRINTABLE:
+                    pairs[prev << 32 | code] = TTF_GetFontKerningSizeGlyphs(
+                        self.font, prev, code
+                    )
+        return pairs
+
+    def check_kerning(self, pairs):
+        if any(pairs.values()):
+            self.kerns.update(pairs)
+        else:
+            # If none of the pairs kern, assume the font has no kerning (SDL_ttf has
+            # no way to ask), as is the case for icon fonts.
+            self.kerned = False
+            self.kerns = {}
+            # Anything measured so far was measured with kerning.
+            self.measured.clear()
+            self.measured_chars = 0
+
+    def prepare(self, renderer, kerning=True):
+        # Pre-render the printable ASCII characters (in the background).
+        self.rasterize(PRINTABLE)
+        if kerning and self.kerned:
+            self.check_kerning(self.kerning_pairs())
+        for code in PRINTABLE:
+            self.glyph(renderer, code)
 
-    def prepare(self, renderer):
-        # Pre-render the printable ASCII characters.
-        for i in range(32, 127):
-            self.glyph(renderer, i)
+    async def prepare_async(self, renderer, kerning=True):
+        """
+        Like prepare, but renders the glyphs and looks up kerning in the background,
+        so the event loop keeps running in the meantime. Only loading the glyphs into
+        atlases happens on the event loop (i.e. the render thread).
+        """
+        rendering = [asyncio.wrap_future(f) for f in self.rasterize(PRINTABLE)]
+        if kerning and self.kerned:
+            loop = asyncio.get_running_loop()
+            self.check_kerning(
+                await loop.run_in_executor(self.pool(), self.kerning_pairs)
+            )
+        await asyncio.gather(*rendering)
+        for code in PRINTABLE:
+            self.glyph(renderer, code)
 
-    def words(self, text, kerning=True):
+    def words(self, text, kerning=True, metrics=None):
         """
         Yields a series of words (start/end index range) and the width of the word.
         Words are automatically broken by punctuation, spaces, or newlines. Unprintable
         characters are skipped (but break words).
         """
+        codes, sizes, kerns = metrics or self.metrics(text, kerning)
+        # The offset of each character, if the text were all on one line.
+        offsets = list(itertools.accumulate(map(operator.add, sizes, kerns), initial=0))
         start = 0
-        width = 0
-        prev = None
-        textlen = len(text)
-        for idx in range(textlen):
-            code = ord(text[idx])
-            if code == 10:
-                # Newline.
+        for match in segmenter().finditer(text):
+            kind = match.lastgroup
+            idx, end = match.span()
+            if kind == "newline" or kind == "control" or kind == "space":
+                # Unprintable characters are ignored, but break words like newlines and
+                # spaces do.
                 if idx > start:
-                    yield start, idx, width
-                yield idx, idx + 1, 0
-                start = idx + 1
-                width = 0
-                prev = None
-            elif code < 32:
-                # Unprintable, ignore (but count as a word break).
-                if idx > start:
-                    yield start, idx, width
-                start = idx + 1
-                width = 0
-                # Leave prev alone, so the next letter kerns over the unprintable
-                # character.
-            else:
-                size = self.glyph_size(code)
-                kern = (
-                    TTF_GetFontKerningSizeGlyphs(self.font, prev, code)
-                    if kerning and prev
-                    else 0
-                )
-                if code == 32:
-                    # Space, break word.
-                    if idx > start:
-                        yield start, idx, width
-                    yield idx, idx + 1, size.w
-                    start = idx + 1
-                    width = 0
-                elif unicodedata.category(text[idx]).startswith("P"):
-                    # Punctuation, break word (including trailing punctuation).
-                    width += size.w + kern
-                    yield start, idx + 1, width
-                    start = idx + 1
-                    width = 0
-                else:
-                    # Printable character.
-                    width += size.w + kern
-                prev = code
-        if textlen > start:
-            yield start, textlen, width
+                    yield start, idx, offsets[idx] - offsets[start]
+                if kind == "newline":
+                    yield idx, end, 0
+                elif kind == "space":
+                    yield idx, end, sizes[idx]
+                start = end
+            elif kind == "punct" or (
+                kind == "astral" and unicodedata.category(match.group()).startswith("P")
+            ):
+                # Punctuation, break word (including trailing punctuation).
+                yield start, end, offsets[end] - offsets[start]
+                start = end
+        if len(text) > start:
+            yield start, len(text), offsets[-1] - offsets[start]
 
     def layout(self, text, width, kerning=True, wrap=True):
         """
@@ -176,19 +524,49 @@ class Font:
         contains 0 or more tuples containing:
             (index_in_text, code_point, start_x, kerning, max_x)
         """
+        metrics = self.metrics(text, kerning)
+        codes, sizes, kerns = metrics
+        if not kerning and self.kerned:
+            # Words are always measured with kerning.
+            metrics = self.metrics(text)
         x = 0
         prev = None
         line = []
         continuation = False
-        for start, end, w in self.words(text):
+        for start, end, w in self.words(text, metrics=metrics):
             if wrap and (x + w > width):
                 prev = None
                 x = 0
                 continuation = True
                 yield line
                 line = []
+            code = codes[start]
+            if code != 10 and code != 32:
+                # Lay out the whole word at once, as long as none of it needs wrapping.
+                word = kerns[start:end]
+                if prev is None:
+                    word[0] = 0
+                extents = list(
+                    itertools.accumulate(
+                        map(operator.add, sizes[start:end], word), initial=x
+                    )
+                )
+                if not wrap or max(extents) <= width:
+                    line.extend(
+                        zip(
+                            range(start, end),
+                            codes[start:end],
+                            extents,
+                            word,
+                            extents[1:],
+                        )
+                    )
+                    x = extents[-1]
+                    prev = codes[end - 1]
+                    continuation = False
+                    continue
             for idx in range(start, end):
-                code = ord(text[idx])
+                code = codes[idx]
                 if code == 10:
                     prev = None
                     x = 0
@@ -198,54 +576,115 @@ class Font:
                     continue
                 if code == 32 and continuation:
                     continue
-                kern = (
-                    TTF_GetFontKerningSizeGlyphs(self.font, prev, code)
-                    if kerning and prev
-                    else 0
-                )
-                size = self.glyph_size(code)
-                if wrap and (x + size.w + kern > width):
+                kern = kerns[idx] if prev else 0
+                size = sizes[idx]
+                if wrap and (x + size + kern > width):
                     prev = None
                     kern = 0
                     x = 0
                     continuation = True
                     yield line
                     line = []
-                line.append((idx, code, x, kern, x + size.w + kern))
-                x += size.w + kern
+                line.append((idx, code, x, kern, x + size + kern))
+                x += size + kern
                 prev = code
                 continuation = False
         yield line
 
-    def measure(self, text, width=None, kerning=True, wrap=True):
+    def lines(self, text, width, kerning=True, wrap=True):
         """
-        Returns how much space the given text would take up when rendered, optionally
-        with a width constraint.
+        Returns how much space the given text would take up when laid out with a
+        maximum width, and the lines it was laid out into (see layout). The most
+        recently measured text is cached, so the lines should not be modified.
         """
+        key = (text, width, kerning, wrap)
+        if key in self.measured:
+            self.hits += 1
+            self.measured.move_to_end(key)
+            return self.measured[key]
+        self.misses += 1
         max_x = 0
         y = 0
-        for line in self.layout(text, width or 2**14, kerning=kerning, wrap=wrap):
+        lines = list(self.layout(text, width, kerning=kerning, wrap=wrap))
+        for line in lines:
             if line:
                 # Take the maximum extent of the last character on each line.
                 max_x = max(max_x, line[-1][-1])
             y += self.line_height
-        return Size(max_x, y)
+        result = (Size(max_x, y), lines)
+        if len(text) <= self.measure_limit:
+            self.measured[key] = result
+            self.measured_chars += len(text) + 1
+            while self.measured_chars > self.measure_limit:
+                old, _ = self.measured.popitem(last=False)
+                self.measured_chars -= len(old[0]) + 1
+        return result
+
+    def measure(self, text, width=None, kerning=True, wrap=True):
+        """
+        Returns how much space the given text would take up when rendered, optionally
+        with a width constraint.
+        """
+        width = width or 2**14
+        if "\n" not in text:
+            # Single lines (most labels) are just the sum of their glyph widths and
+            # kerning, as long as no part of them needs wrapping.
+            codes, sizes, kerns = self.metrics(text, kerning)
+            if kerns:
+                kerns[0] = 0
+            extents = list(
+                itertools.accumulate(map(operator.add, sizes, kerns), initial=0)
+            )
+            if not wrap or max(extents) <= width:
+                return Size(extents[-1], self.line_height)
+        return self.lines(text, width, kerning=kerning, wrap=wrap)[0]
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
 
     def find(self, text, rect, pt, kerning=True, lines=None):
         """
         Given text laid out inside rect, finds the index in the text under the given
-        point.
+        point. Each character spans from its x offset to its extent (the last one on a
+        line to the edge of rect), and the full line height, edges included.
+        """
+        found = self.locate(text, rect, pt, kerning=kerning, lines=lines)
+        return None if found is None else found[0]
+
+    def locate(self, text, rect, pt, kerning=True, lines=None):
+        """
+        Like find, but returns the character's tuple from its line (see layout).
         """
-        y = rect.top
         if lines is None:
-            lines = self.layout(text, rect.width, kerning=kerning)
-        for line in lines:
-            for pos, (idx, code, x, kern, extent), last in enumerate_last(line):
-                w = rect.width - x if last else extent - x
-                r = Rect(origin=(rect.left + x, y), size=(w, self.line_height))
-                if pt in r:
-                    return idx
-            y += self.line_height
+            lines = self.lines(text, rect.width, kerning=kerning)[1]
+        y = pt.y - rect.top
+        if y < 0:
+            return None
+        row = y // self.line_height
+        # A point on the boundary between two lines is in both, and the first wins.
+        rows = (row - 1, row) if row and not y % self.line_height else (row,)
+        x = pt.x - rect.left
+        for row in rows:
+            if row >= len(lines) or not lines[row]:
+                continue
+            line = lines[row]
+            # Find the first character extending to x, then check it starts before x.
+            lo = 0
+            hi = len(line) - 1
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if line[mid][4] < x:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            pos = lo
+            if pos < len(line) - 1:
+                if line[pos][2] <= x:
+                    return line[pos]
+            elif line[pos][2] <= x <= rect.width:
+                return line[pos]
         return None
 
     def draw(
@@ -261,23 +700,201 @@ class Font:
     ):
         """
         Renders text in the specified rect, using the specified color. If specified,
-        selected is a set of indexes in text that should be highlighted.
+        selected is a range of indexes in text that should be highlighted.
         """
         y = rect.top
         if lines is None:
-            lines = list(self.layout(text, rect.width, kerning=kerning, wrap=wrap))
+            lines = self.lines(text, rect.width, kerning=kerning, wrap=wrap)[1]
+        address = ctypes.addressof(renderer.contents)
+        # The destination and source rects of each glyph to draw, per atlas.
+        quads = {}
+        highlights = []
+        rasterized = False
         for line in lines:
+            # The start, end, and height of the selected part of the line.
+            start = None
             for idx, code, x, kern, extent in line:
-                tex, size = self.glyph(renderer, code)
-                sdl2.SDL_SetTextureColorMod(tex, color.r, color.g, color.b)
-                sdl2.SDL_SetTextureAlphaMod(tex, color.a)
-                dst = sdl2.SDL_Rect(rect.left + x + kern, y, size.w, size.h)
-                sdl2.SDL_RenderCopy(renderer, tex, None, ctypes.byref(dst))
-                if selected and idx in selected:
-                    sdl2.SDL_SetRenderDrawColor(renderer, 20, 60, 120, 255)
-                    sdl2.SDL_SetRenderDrawBlendMode(renderer, sdl2.SDL_BLENDMODE_ADD)
-                    sdl2.SDL_RenderFillRect(
-                        renderer, sdl2.SDL_Rect(rect.left + x, y, size.w + kern, size.h)
+                glyph = self.glyphs.get((address, code))
+                if glyph is None:
+                    if not rasterized:
+                        # Queue all the glyphs that haven't been loaded at once, rather
+                        # than rendering them one at a time as they are met.
+                        self.rasterize(
+                            item[1]
+                            for row in lines
+                            for item in row
+                            if (address, item[1]) not in self.glyphs
+                        )
+                        rasterized = True
+                    glyph = self.glyph(renderer, code)
+                atlas, src, size = glyph
+                if size.w and size.h:
+                    quads.setdefault(atlas, []).append(
+                        (rect.left + x + kern, y, src, size)
                     )
+                if selected and idx in selected:
+                    if start is None:
+                        start = x
+                        height = size.h
+                    end = extent
+                    height = max(height, size.h)
+            if start is not None:
+                highlights.append(
+                    sdl2.SDL_Rect(rect.left + start, y, end - start, height)
+                )
             y += self.line_height
+        for atlas, glyphs in quads.items():
+            self.draw_glyphs(renderer, atlas, glyphs, color)
+            self.recent.move_to_end(atlas)
+        if self.memory > self.glyph_budget:
+            self.trim()
+        if highlights:
+            mode = sdl2.SDL_BlendMode()
+            sdl2.SDL_GetRenderDrawBlendMode(renderer, ctypes.byref(mode))
+            sdl2.SDL_SetRenderDrawColor(renderer, 20, 60, 120, 255)
+            sdl2.SDL_SetRenderDrawBlendMode(renderer, sdl2.SDL_BLENDMODE_ADD)
+            for highlight in highlights:
+                sdl2.SDL_RenderFillRect(renderer, highlight)
+            sdl2.SDL_SetRenderDrawBlendMode(renderer, mode)
         return lines
+
+    def draw_glyphs(self, renderer, atlas, glyphs, color):
+        """
+        Draws a list of (x, y, source rect, size) glyphs from an atlas, all at once if
+        the atlas can be drawn using SDL_RenderGeometry.
+        """
+        if not atlas.batched:
+            sdl2.SDL_SetTextureColorMod(atlas.texture, color.r, color.g, color.b)
+            sdl2.SDL_SetTextureAlphaMod(atlas.texture, color.a)
+            for x, y, src, size in glyphs:
+                dst = sdl2.SDL_Rect(x, y, size.w, size.h)
+                sdl2.SDL_RenderCopy(
+                    renderer, atlas.texture, ctypes.byref(src), ctypes.byref(dst)
+                )
+            return
+        r, g, b, a = color.r, color.g, color.b, color.a
+        aw = atlas.width
+        ah = atlas.height
+        values = []
+        indices = array("i")
+        for num, (x, y, src, size) in enumerate(glyphs):
+            u1 = src.x / aw
+            v1 = src.y / ah
+            u2 = (src.x + src.w) / aw
+            v2 = (src.y + src.h) / ah
+            x2 = x + size.w
+            y2 = y + size.h
+            values.extend(
+                (x, y, r, g, b, a, u1, v1)
+                + (x2, y, r, g, b, a, u2, v1)
+                + (x, y2, r, g, b, a, u1, v2)
+                + (x2, y2, r, g, b, a, u2, v2)
+            )
+            base = num * 4
+            indices.extend((base, base + 1, base + 2, base + 2, base + 1, base + 3))
+        count = len(glyphs) * 4
+        vertices = bytearray(struct.pack("=" + VERTEX * count, *values))
+        sdl2.SDL_RenderGeometry(
+            renderer,
+            atlas.texture,
+            (sdl2.SDL_Vertex * count).from_buffer(vertices),
+            count,
+            (ctypes.c_int * len(indices)).from_buffer(indices),
+            len(indices),
+        )
+
+
+class TextLayout:
+    """
+    Keeps the lines of text laid out by a Font, for text that changes a little at a
+    time (e.g. while typing). Newlines reset the layout, so each paragraph is laid out
+    on its own, and only the paragraphs that changed are laid out again.
+    """
+
+    def __init__(self, font, width, kerning=True, wrap=True):
+        self.font = font
+        self.width = width
+        self.kerning = kerning
+        self.wrap = wrap
+        self.text = ""
+        # The text, offset in the text, lines (relative to the paragraph), and lines
+        # (relative to the text) of each paragraph.
+        self.paragraphs = [["", 0, [[]], [[]]]]
+        self.lines = [[]]
+        # The offset and first line of each paragraph, for finding the caret.
+        self.offsets = [0]
+        self.rows = [0]
+        self.size = Size(0, font.line_height)
+
+    def layout(self, text, offset):
+        lines = list(
+            self.font.layout(text, self.width, kerning=self.kerning, wrap=self.wrap)
+        )
+        return [text, offset, lines, self.shift(lines, offset)]
+
+    def shift(self, lines, offset):
+        if not offset:
+            return lines
+        return [
+            [(idx + offset, code, x, kern, end) for idx, code, x, kern, end in line]
+            for line in lines
+        ]
+
+    def update(self, text):
+        """
+        Lays out text, re-using the lines of any paragraphs at the start or end that
+        haven't changed. Returns the lines, as Font.layout would.
+        """
+        if text == self.text:
+            return self.lines
+        old = self.paragraphs
+        new = text.split("\n")
+        limit = min(len(old), len(new))
+        head = 0
+        while head < limit and old[head][0] == new[head]:
+            head += 1
+        tail = 0
+        while tail < limit - head and old[-1 - tail][0] == new[-1 - tail]:
+            tail += 1
+        paragraphs = old[:head]
+        offset = paragraphs[-1][1] + len(paragraphs[-1][0]) + 1 if paragraphs else 0
+        for para in new[head : len(new) - tail]:
+            paragraphs.append(self.layout(para, offset))
+            offset += len(para) + 1
+        for para in old[len(old) - tail :]:
+            if para[1] != offset:
+                # Moved by the edit, so the indexes of the characters have changed.
+                para = [para[0], offset, para[2], self.shift(para[2], offset)]
+            paragraphs.append(para)
+            offset += len(para[0]) + 1
+        self.text = text
+        self.paragraphs = paragraphs
+        self.lines = []
+        self.offsets = []
+        self.rows = []
+        for para in paragraphs:
+            last = self.lines[-1] if self.lines else None
+            if self.wrap and last and last[-1][-1] > self.width:
+                # The last line didn't fit, so Font.layout wraps again at the newline.
+                self.lines.append([])
+            self.offsets.append(para[1])
+            self.rows.append(len(self.lines))
+            self.lines.extend(para[3])
+        width = max((line[-1][-1] for line in self.lines if line), default=0)
+        self.size = Size(width, len(self.lines) * self.font.line_height)
+        return self.lines
+
+    def caret(self, pos):
+        """
+        Returns the x offset and line number of a caret placed before the character at
+        pos (or at the end of the text), i.e. after the character before it.
+        """
+        num = bisect.bisect_right(self.offsets, pos) - 1
+        local = pos - self.offsets[num]
+        caret = (0, self.rows[num])
+        for row, line in enumerate(self.paragraphs[num][2], self.rows[num]):
+            for idx, code, x, kern, extent in line:
+                if idx >= local:
+                    return caret
+                caret = (extent, row)
+        return caret
@@ -132,6 +132,33 @@ class Rect:
             and (self.bottom >= other.top)
         )
 
+    def union(self, other):
+        """
+        Returns the smallest Rect containing both this Rect and other.
+        """
+        left = min(self.left, other.left)
+        top = min(self.top, other.top)
+        return Rect(
+            origin=(left, top),
+            size=(
+                max(self.right, other.right) - left,
+                max(self.bottom, other.bottom) - top,
+            ),
+        )
+
+    def intersection(self, other):
+        """
+        Returns the overlapping area of this Rect and other, or None if they don't
+        overlap.
+        """
+        left = max(self.left, other.left)
+        top = max(self.top, other.top)
+        right = min(self.right, other.right)
+        bottom = min(self.bottom, other.bottom)
+        if right <= left or bottom <= top:
+            return None
+        return Rect(origin=(left, top), size=(right - left, bottom - top))
+
     def scroll(self, pt):
         return Rect(origin=(self.left - pt.x, self.top - pt.y), size=self.size)
 
@@ -0,0 +1,127 @@
+import json
+import os
+import struct
+import sys
+from collections import namedtuple
+
+# Magic, number of icons, and the length of the font and set names that follow.
+HEADER = struct.Struct("<4sII")
+# Offset of the icon's name (in the names after the records), its code point, the
+# length of its name, its default set, and a bit mask of every set it's in.
+RECORD = struct.Struct("<IIBBBx")
+MAGIC = b"PYUI"
+
+IconInfo = namedtuple("IconInfo", ("text", "sets"))
+
+
+class IconIndex:
+    """
+    Looks up icons by name in a table compiled from an icons.json file (see
+    compile_index), sorted by name so lookups are a binary search. The file is only
+    read the first time an icon is looked up, so nothing is paid for icons unless
+    they're used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+
+    def load(self):
+        if self.data is None:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            magic, self.count, size = HEADER.unpack_from(data)
+            if magic != MAGIC:
+                raise ValueError("Not an icon index: {}".format(self.path))
+            start = HEADER.size
+            self.font, *self.sets = data[start : start + size].decode().split("\0")
+            self.records_start = start + size
+            self.names_start = self.records_start + self.count * RECORD.size
+            self.data = data
+        return self.data
+
+    def name(self, idx):
+        offset, code, length, default, mask = RECORD.unpack_from(
+            self.data, self.records_start + idx * RECORD.size
+        )
+        start = self.names_start + offset
+        return self.data[start : start + length]
+
+    def find(self, name):
+        """
+        Returns the index of the record for name, or None if there is no such icon.
+        """
+        self.load()
+        key = name.encode()
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.name(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self.name(lo) == key:
+            return lo
+        return None
+
+    def __len__(self):
+        self.load()
+        return self.count
+
+    def __iter__(self):
+        self.load()
+        for idx in range(self.count):
+            yield self.name(idx).decode()
+
+    def __contains__(self, name):
+        return self.find(name) is not None
+
+    def __getitem__(self, name):
+        idx = self.find(name)
+        if idx is None:
+            raise KeyError(name)
+        offset, code, length, default, mask = RECORD.unpack_from(
+            self.data, self.records_start + idx * RECORD.size
+        )
+        sets = [self.sets[default]]
+        for i, s in enumerate(self.sets):
+            if mask & (1 << i) and i != default:
+                sets.append(s)
+        return IconInfo(chr(code), sets)
+
+
+def compile_index(source, path):
+    """
+    Compiles an icons.json file (a font name, and the text and sets of each icon by
+    name) into an index that IconIndex can read.
+    """
+    with open(source) as f:
+        config = json.load(f)
+    icons = sorted((name.encode(), info) for name, info in config["icons"].items())
+    sets = []
+    for name, info in icons:
+        for s in info["sets"]:
+            if s not in sets:
+                sets.append(s)
+    strings = "\0".join([config["font"]] + sets).encode()
+    records = []
+    names = b""
+    for name, info in icons:
+        default = sets.index(info["sets"][0])
+        mask = sum(1 << sets.index(s) for s in info["sets"])
+        records.append(
+            RECORD.pack(len(names), ord(info["text"]), len(name), default, mask)
+        )
+        names += name
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(icons), len(strings)))
+        f.write(strings)
+        f.write(b"".join(records))
+        f.write(names)
+
+
+if __name__ == "__main__":
+    # Recompiles the bundled index, e.g. after updating icons.json.
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    source = sys.argv[1:] or [os.path.join(data_dir, "icons.json")]
+    compile_index(source[0], os.path.join(data_dir, "icons.idx"))
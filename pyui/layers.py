@@ -0,0 +1,167 @@
+import collections
+import ctypes
+
+import sdl2
+
+from .views.base import View
+
+# Layers are drawn with premultiplied alpha, which is what drawing onto a transparent
+# texture with SDL_BLENDMODE_BLEND produces.
+PREMULTIPLIED = sdl2.SDL_ComposeCustomBlendMode(
+    sdl2.SDL_BLENDFACTOR_ONE,
+    sdl2.SDL_BLENDFACTOR_ONE_MINUS_SRC_ALPHA,
+    sdl2.SDL_BLENDOPERATION_ADD,
+    sdl2.SDL_BLENDFACTOR_ONE,
+    sdl2.SDL_BLENDFACTOR_ONE_MINUS_SRC_ALPHA,
+    sdl2.SDL_BLENDOPERATION_ADD,
+)
+
+
+class Layer:
+    def __init__(self, texture, size):
+        self.texture = texture
+        self.size = size
+        self.bytes = size.w * size.h * 4
+        # Set when something inside the layer changed, so it must be drawn again.
+        self.stale = True
+        # The value of View.placements when the layer was drawn, and the frames of the
+        # views inside it (relative to the layer), to tell if they moved since.
+        self.placements = None
+        self.shape = None
+
+
+class LayerCache:
+    """
+    Keeps rasterized views (see View.rasterize) drawn into textures, which are copied to
+    the screen instead of drawing the views again until something inside them changes.
+    The least recently used layers are freed to stay within a budget of texture memory.
+    """
+
+    def __init__(self, renderer, budget=64 * 1024 * 1024):
+        self.renderer = renderer
+        self.budget = budget
+        self.used = 0
+        self.layers = collections.OrderedDict()
+        # Cleared if the renderer doesn't support premultiplied alpha blending, in which
+        # case rasterized views are drawn normally.
+        self.supported = True
+
+    def __len__(self):
+        return len(self.layers)
+
+    def shape(self, view):
+        origin = view.frame.origin
+        shape = []
+        stack = [view]
+        while stack:
+            v = stack.pop()
+            frame = v.frame
+            shape.append(
+                (id(v), frame.left - origin.x, frame.top - origin.y, frame.size)
+            )
+            stack.extend(v.subviews)
+        return shape
+
+    def stale(self, view):
+        """
+        Marks any layers containing view as needing to be drawn again.
+        """
+        while view is not None:
+            layer = self.layers.get(view)
+            if layer is not None:
+                layer.stale = True
+            view = view.parent
+
+    def reset(self):
+        """
+        Marks every layer as needing to be drawn again.
+        """
+        for layer in self.layers.values():
+            layer.stale = True
+
+    def discard(self, view):
+        layer = self.layers.pop(view, None)
+        if layer is not None:
+            sdl2.SDL_DestroyTexture(layer.texture)
+            self.used -= layer.bytes
+
+    def clear(self):
+        for view in list(self.layers):
+            self.discard(view)
+
+    def create(self, view):
+        size = view.frame.size
+        if not self.supported or not size.w or not size.h:
+            return None
+        if size.w * size.h * 4 > self.budget:
+            return None
+        self.discard(view)
+        texture = sdl2.SDL_CreateTexture(
+            self.renderer,
+            sdl2.SDL_PIXELFORMAT_ARGB8888,
+            sdl2.SDL_TEXTUREACCESS_TARGET,
+            size.w,
+            size.h,
+        )
+        if not texture:
+            return None
+        if sdl2.SDL_SetTextureBlendMode(texture, PREMULTIPLIED) != 0:
+            sdl2.SDL_DestroyTexture(texture)
+            self.supported = False
+            return None
+        layer = Layer(texture, size)
+        self.layers[view] = layer
+        self.used += layer.bytes
+        while self.used > self.budget:
+            self.discard(next(iter(self.layers)))
+        return layer
+
+    def draw(self, view, layer):
+        renderer = self.renderer
+        frame = view.frame
+        previous = sdl2.SDL_GetRenderTarget(renderer)
+        clip = sdl2.SDL_Rect()
+        clipped = sdl2.SDL_RenderIsClipEnabled(renderer)
+        sdl2.SDL_RenderGetClipRect(renderer, ctypes.byref(clip))
+        sdl2.SDL_SetRenderTarget(renderer, layer.texture)
+        sdl2.SDL_SetRenderDrawColor(renderer, 0, 0, 0, 0)
+        sdl2.SDL_RenderClear(renderer)
+        # Offset the viewport so views can draw at their usual coordinates.
+        sdl2.SDL_RenderSetViewport(
+            renderer,
+            sdl2.SDL_Rect(-frame.left, -frame.top, frame.right, frame.bottom),
+        )
+        sdl2.SDL_RenderSetClipRect(renderer, ctypes.byref(frame.sdl))
+        # Cleared first, so anything damaged while drawing (e.g. by an animated view) is
+        # drawn again on the next frame.
+        layer.stale = False
+        damaged, View.damaged = View.damaged, None
+        try:
+            view.draw_tree(renderer)
+        finally:
+            View.damaged = damaged
+        sdl2.SDL_SetRenderTarget(renderer, previous or None)
+        sdl2.SDL_RenderSetClipRect(renderer, ctypes.byref(clip) if clipped else None)
+        layer.placements = View.placements
+        layer.shape = self.shape(view)
+
+    def render(self, view):
+        """
+        Copies the layer for view to the screen, drawing it first if necessary. Returns
+        False if the view could not be rasterized and should be drawn as usual.
+        """
+        layer = self.layers.get(view)
+        if layer is None or layer.size != view.frame.size:
+            layer = self.create(view)
+            if layer is None:
+                return False
+        if not layer.stale and layer.placements != View.placements:
+            # Something was laid out since the layer was drawn, but it only needs to be
+            # drawn again if views inside it changed size or moved within it.
+            layer.stale = layer.shape != self.shape(view)
+            layer.placements = View.placements
+        if layer.stale:
+            self.draw(view, layer)
+        self.layers.move_to_end(view)
+        sdl2.SDL_RenderCopy(self.renderer, layer.texture, None, view.frame.sdl)
+        return True
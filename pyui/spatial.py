@@ -0,0 +1,53 @@
+class SpatialIndex:
+    """
+    Buckets the frames of a laid out view hierarchy into a uniform grid of cells, so
+    finding the view at a point only checks the views overlapping a single cell, rather
+    than walking the whole hierarchy. Each view is indexed by its frame clipped to the
+    frames of its ancestors, and views with any of the given boolean attributes set
+    (e.g. interactive) are also bucketed separately.
+
+    Lookups give the same result as View.find -- of the views containing the point
+    (whose ancestors also contain it), the first one in depth-first, subviews-first
+    order wins.
+    """
+
+    def __init__(self, root, attrs=(), cell=64):
+        self.cell = cell
+        self.attrs = attrs
+        self.buckets = {None: {}}
+        for attr in attrs:
+            self.buckets[attr] = {}
+        frame = root.frame
+        self.add(root, frame.left, frame.top, frame.right, frame.bottom)
+
+    def add(self, view, left, top, right, bottom):
+        frame = view.frame
+        left = max(left, frame.left)
+        top = max(top, frame.top)
+        right = min(right, frame.right)
+        bottom = min(bottom, frame.bottom)
+        if left > right or top > bottom:
+            # No point can be inside this view, or anything inside it.
+            return
+        for subview in view.subviews:
+            self.add(subview, left, top, right, bottom)
+        # Added after any subviews, which take precedence.
+        entry = (left, top, right, bottom, view)
+        buckets = [self.buckets[None]]
+        for attr in self.attrs:
+            if getattr(view, attr, None) is True:
+                buckets.append(self.buckets[attr])
+        for x in range(left // self.cell, right // self.cell + 1):
+            for y in range(top // self.cell, bottom // self.cell + 1):
+                for bucket in buckets:
+                    bucket.setdefault((x, y), []).append(entry)
+
+    def find(self, pt, attr=None):
+        """
+        Returns the view at pt, optionally only considering views with attr set.
+        """
+        cell = (pt.x // self.cell, pt.y // self.cell)
+        for left, top, right, bottom, view in self.buckets[attr].get(cell, ()):
+            if left <= pt.x <= right and top <= pt.y <= bottom:
+                return view
+        return None
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 
@@ -23,6 +24,11 @@ class Theme:
         for name in self.config["fonts"]:
             self.font(name).prepare(renderer)
 
+    async def prepare_async(self, renderer):
+        await asyncio.gather(
+            *(self.font(name).prepare_async(renderer) for name in self.config["fonts"])
+        )
+
     def font(self, name="default", size=None):
         info = self.config["fonts"].get(name, {})
         filename = info.get("file", name)
@@ -1,50 +1,58 @@
-from .base import ForEach, View
-from .control import Button, SecureField, SegmentedButton, Slider, TextField, Toggle
-from .grid import Grid
-from .image import Image
-from .nav import List, Section, TabView
-from .picker import Picker
-from .progress import ProgressBar
-from .scroll import ScrollView
-from .shape import Rectangle
-from .spinner import Spinner
-from .stack import HStack, Spacer, VStack
-from .text import Icon, Text
+import importlib
 
-__all__ = [
+# The module each view is defined in. Views are imported when first used (see
+# __getattr__), so importing pyui doesn't load every view module up front.
+VIEWS = {
     # base
-    "ForEach",
-    "View",
+    "ForEach": ".base",
+    "View": ".base",
     # control
-    "Button",
-    "SecureField",
-    "SegmentedButton",
-    "Slider",
-    "TextField",
-    "Toggle",
+    "Button": ".control",
+    "SecureField": ".control",
+    "SegmentedButton": ".control",
+    "Slider": ".control",
+    "TextField": ".control",
+    "Toggle": ".control",
     # grid
-    "Grid",
+    "Grid": ".grid",
     # image
-    "Image",
+    "Image": ".image",
+    # lazy
+    "LazyHStack": ".lazy",
+    "LazyVStack": ".lazy",
     # nav
-    "List",
-    "Section",
-    "TabView",
+    "List": ".nav",
+    "Section": ".nav",
+    "TabView": ".nav",
     # picker
-    "Picker",
+    "Picker": ".picker",
     # progress
-    "ProgressBar",
+    "ProgressBar": ".progress",
     # scroll
-    "ScrollView",
+    "ScrollView": ".scroll",
     # shape
-    "Rectangle",
+    "Rectangle": ".shape",
     # spinner
-    "Spinner",
+    "Spinner": ".spinner",
     # stack
-    "HStack",
-    "Spacer",
-    "VStack",
+    "HStack": ".stack",
+    "Spacer": ".stack",
+    "VStack": ".stack",
     # text
-    "Icon",
-    "Text",
-]
+    "Icon": ".text",
+    "Text": ".text",
+}
+
+__all__ = list(VIEWS)
+
+
+def __getattr__(name):
+    if name not in VIEWS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(VIEWS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
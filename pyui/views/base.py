@@ -7,9 +7,38 @@ from sdl2.sdlgfx import boxRGBA, roundedBoxRGBA
 from pyui.animation import Animation, parametric
 from pyui.env import Environment
 from pyui.geom import Alignment, Axis, Insets, Point, Position, Priority, Rect, Size
+from pyui.state import Binding
 from pyui.utils import clamp
 
 
+def same(old, new):
+    """
+    Returns whether a value a view was updated with is the same as its old value, for
+    View.update. Values that are equal count, as do the values (like environments and
+    insets) that are built anew each time a view is, if they hold the same things.
+    """
+    if old.__class__ is not new.__class__:
+        return False
+    if isinstance(old, Binding):
+        return old.state is new.state and old.instance is new.instance
+    if isinstance(old, Environment):
+        # Only compare values set on the environments, not inherited ones.
+        mine = {k: v for k, v in old.__dict__.items() if k != "parent"}
+        theirs = {k: v for k, v in new.__dict__.items() if k != "parent"}
+        return mine.keys() == theirs.keys() and all(
+            same(mine[k], theirs[k]) for k in mine
+        )
+    if isinstance(old, (Insets, Animation)):
+        return vars(old) == vars(new)
+    if isinstance(old, sdl2.SDL_Color):
+        return bytes(old) == bytes(new)
+    try:
+        return bool(old == new)
+    except Exception:
+        # Values that don't compare to a bool (e.g. NumPy arrays) changed.
+        return False
+
+
 class EnvironmentalView:
     def __init__(self):
         self.env = Environment()
@@ -23,6 +52,7 @@ class EnvironmentalView:
             self.env.font = font
         if size:
             self.env.font_size = int(size)
+        self.invalidate()
         return self
 
     def shadow(self, *rgba):
@@ -54,10 +84,12 @@ class EnvironmentalView:
 
     def padding(self, *tlbr):
         self.env.padding = Insets(*tlbr).scaled(self.env.scale)
+        self.invalidate()
         return self
 
     def border(self, *tlbr):
         self.env.border = Insets(*tlbr).scaled(self.env.scale)
+        self.invalidate()
         return self
 
     def border_color(self, *rgba):
@@ -69,6 +101,7 @@ class EnvironmentalView:
 
     def priority(self, p):
         self.env.priority = Priority[p.upper()] if isinstance(p, str) else Priority(p)
+        self.invalidate()
         return self
 
     def position(self, p):
@@ -83,6 +116,7 @@ class EnvironmentalView:
 
     def spacing(self, s):
         self.env.spacing = self.env.scaled(int(s))
+        self.invalidate()
         return self
 
     def size(self, width=None, height=None):
@@ -91,6 +125,7 @@ class EnvironmentalView:
         if isinstance(height, int):
             height = self.env.scaled(height)
         self.env.size = Size(width or self.env.size.w, height or self.env.size.h)
+        self.invalidate()
         return self
 
     def opacity(self, value):
@@ -103,14 +138,21 @@ class EnvironmentalView:
 
     def lines(self, num):
         self.env.lines = max(0, int(num)) if num else 0
+        self.invalidate()
         return self
 
+    def invalidate(self):
+        # Called by modifiers that affect measurement. Views override this to discard
+        # any cached sizes.
+        pass
+
 
 class View(EnvironmentalView):
     interactive = False
     draws_focus = True
     disabled = False
     scrollable = False
+    rasterized = False
 
     hovering = False
 
@@ -118,10 +160,39 @@ class View(EnvironmentalView):
     _window = None
     parent = None
     index = 0
+    # Identifies this view among its siblings across rebuilds, see key().
+    _key = None
+    # Cached id and id_path, reset whenever the view is attached to a parent.
+    _id = None
+    _id_path = None
 
     # Set when moving/resizing an existing view, to do animations.
     _old_frame = None
 
+    # Cached result of minimum_size, see measure() and invalidate(). The last measured
+    # size is kept after invalidation, so relayout can tell whether it changed.
+    _minimum = None
+    _measured = False
+
+    # What this view was last offered by fit() and place(), so it can be laid out again
+    # without involving its parent.
+    _offer = None
+    _inside = None
+
+    # The frame size and result of the last resize, reused by fit() while the offer is
+    # the same and the view hasn't been invalidated.
+    _fitted = None
+
+    # How many fit() calls were answered from the cache, or had to resize.
+    fit_hits = 0
+    fit_misses = 0
+    # Incremented whenever any view is placed or moved, so anything derived from view
+    # frames (such as a SpatialIndex) knows when it is out of date.
+    placements = 0
+    # While rendering, the area being redrawn, or None if the whole window is. Views
+    # outside of it don't need to draw anything.
+    damaged = None
+
     def __init__(self, *contents, **options):
         super().__init__()
         # Overall frame of the View, including padding and border.
@@ -140,11 +211,20 @@ class View(EnvironmentalView):
 
     @property
     def id(self):
-        return "{}-{}".format(self.__class__.__name__, self.index)
+        if self._id is None:
+            if self._key is not None:
+                self._id = "{}[{!r}]".format(self.__class__.__name__, self._key)
+            else:
+                self._id = "{}-{}".format(self.__class__.__name__, self.index)
+        return self._id
 
     @property
     def id_path(self):
-        return self.parent.id_path + (self.id,) if self.parent else (self.id,)
+        if self._id_path is None:
+            self._id_path = (
+                self.parent.id_path + (self.id,) if self.parent else (self.id,)
+            )
+        return self._id_path
 
     @property
     def subviews(self):
@@ -179,47 +259,103 @@ class View(EnvironmentalView):
                 return view
 
     def rebuild(self):
-        # TODO: this is not great. I'm using id_path out of convenience, but ideally
-        # this would use some sort of View hash value and equality testing to be able to
-        # detect if a view moves around in the hierarchy.
-        old = {v.id_path: v for v in self.subviews}
+        # Existing views are matched up with new ones by id_path, which uses the key of
+        # keyed views and the index of any others. Keyed views are found wherever they
+        # move to, so only views that were added, removed, or changed are built or
+        # invalidated.
+        previous = self._subviews
+        old = {v.id_path: v for v in previous}
         self._subviews = []
         for idx, view in enumerate(self.content()):
-            if not isinstance(view, View):
-                raise ValueError(
-                    "Subviews must be instances of View (got {}).".format(
-                        view.__class__.__name__
-                    )
+            self._subviews.append(self.attach(view, idx, old))
+        self.detach(old.values())
+        if self._subviews != previous:
+            self.invalidate()
+            window = self.window
+            if window is not None:
+                # Subviews may have been reordered, which changes the focus order.
+                window.chain = None
+                window.layers.stale(self)
+
+    def attach(self, view, idx, old):
+        """
+        Sets up a newly built view as the subview at idx, re-using (and popping) any
+        view it replaces from old, a dict of existing subviews by id_path. Returns the
+        view that should be used as the subview.
+        """
+        if not isinstance(view, View):
+            raise ValueError(
+                "Subviews must be instances of View (got {}).".format(
+                    view.__class__.__name__
                 )
-            # Set up the view/environment hierarchy.
-            view.parent = self
-            view.index = idx
-            view.env.inherit(self.env)
-            # Let any existing view that this may replace decide if it can be re-used.
-            old_view = old.pop(view.id_path, None)
-            old_frame = None
-            if old_view and old_view.frame:
-                old_frame = old_view.frame.copy()
-            if old_view and old_view.reuse(view):
-                old_view.update(view)
-                view = old_view
-                asyncio.create_task(view.updated())
-            else:
-                asyncio.create_task(view.built())
-            view._old_frame = old_frame
-            # Rebuild/diff down the tree.
-            view.rebuild()
-            self._subviews.append(view)
-        for path, view in old.items():
+            )
+        # Set up the view/environment hierarchy.
+        view.parent = self
+        view.index = idx
+        view._id = view._id_path = None
+        view.env.inherit(self.env)
+        # Let any existing view that this may replace decide if it can be re-used.
+        old_view = old.pop(view.id_path, None)
+        old_frame = None
+        if old_view and old_view.frame:
+            old_frame = old_view.frame.copy()
+        if old_view and old_view.reuse(view):
+            old_view.update(view)
+            view = old_view
+            asyncio.create_task(view.updated())
+        else:
+            asyncio.create_task(view.built())
+        view._old_frame = old_frame
+        window = self.window
+        if window is not None:
+            window.register(view)
+        # Rebuild/diff down the tree.
+        view.rebuild()
+        return view
+
+    def detach(self, views):
+        """
+        Lets any subviews that were not re-used (and are no longer attached) know that
+        they were removed. They are cut off from this view, so they no longer reach the
+        window through their root (see View.window).
+        """
+        window = self.window
+        for view in views:
+            if window is not None:
+                window.unregister(view)
+            view.parent = None
             asyncio.create_task(view.removed())
 
     def reuse(self, other):
         return True
 
     def update(self, other):
+        changed = False
         for key, value in other.__dict__.items():
-            if not key.startswith("_"):
-                setattr(self, key, value)
+            if key.startswith("_") or key == "frame":
+                continue
+            # The contents are compared when rebuilding, and moving isn't a change.
+            # Callables (actions, builders) are compared by what they build, if at all.
+            if key in ("contents", "index") or callable(value):
+                pass
+            elif not changed:
+                changed = not same(getattr(self, key, None), value)
+            setattr(self, key, value)
+        if changed:
+            self.invalidate()
+            self.damage()
+
+    def invalidate(self):
+        """
+        Discards the cached minimum size and layout of this view, and of any ancestors
+        that were measured or laid out from it. Called when the view is rebuilt,
+        updated, or has its environment modified.
+        """
+        view = self
+        while view is not None and (view._measured or view._fitted is not None):
+            view._measured = False
+            view._fitted = None
+            view = view.parent
 
     def content(self):
         for view in self.contents:
@@ -231,6 +367,16 @@ class View(EnvironmentalView):
         for view in self.subviews:
             view.dump(level + 1)
 
+    def measure(self):
+        """
+        Returns minimum_size, cached until the view is invalidated. Views should use
+        this when measuring their subviews.
+        """
+        if not self._measured:
+            self._minimum = self.minimum_size()
+            self._measured = True
+        return self._minimum
+
     def minimum_size(self):
         """
         Returns the minimum size in each dimension of this view's content, not including
@@ -239,7 +385,7 @@ class View(EnvironmentalView):
         min_w = 0
         min_h = 0
         for view in self.subviews:
-            m = view.minimum_size()
+            m = view.measure()
             min_w = max(
                 m.w,
                 min_w
@@ -323,6 +469,22 @@ class View(EnvironmentalView):
                     *rgba
                 )
 
+    def fit(self, available: Size):
+        """
+        Calls resize, remembering the available size so this view can later be laid out
+        again on its own. If nothing changed since the last call with the same size, the
+        previous layout is reused. Views should use this when resizing their subviews.
+        """
+        if self._fitted is not None and available == self._offer:
+            View.fit_hits += 1
+            self.frame.size, result = self._fitted
+            return result
+        View.fit_misses += 1
+        result = self.resize(available)
+        self._offer = available
+        self._fitted = (self.frame.size, result)
+        return result
+
     def resize(self, available: Size):
         """
         Sets the view's frame size, taking into account content size, padding, and
@@ -336,7 +498,7 @@ class View(EnvironmentalView):
             max(0, available.h - self.env.padding.height - self.env.border.height),
         )
         for view in self.subviews:
-            view.resize(inside)
+            view.fit(inside)
             max_w = max(max_w, view.frame.width)
             max_h = max(max_h, view.frame.height)
         size = self.content_size(inside)
@@ -348,6 +510,15 @@ class View(EnvironmentalView):
         )
         return Size(max_w, max_h)
 
+    def place(self, inside: Rect):
+        """
+        Calls reposition, remembering the rect so this view can later be laid out again
+        on its own. Views should use this when positioning their subviews.
+        """
+        View.placements += 1
+        self._inside = inside
+        self.reposition(inside)
+
     def reposition(self, inside: Rect):
         """
         Sets the view's frame origin.
@@ -355,11 +526,12 @@ class View(EnvironmentalView):
         self.position_inside(inside)
         inner = inside - self.env.padding - self.env.border
         for view in self.subviews:
-            view.reposition(inner)
+            view.place(inner)
         if self._old_frame:
             if self.env.animation and self._old_frame != self.frame:
 
                 def _set_frame(new_frame):
+                    View.placements += 1
                     self.frame = new_frame
                     self.window.needs_render = True
 
@@ -392,12 +564,33 @@ class View(EnvironmentalView):
         if not self._subviews:
             self.rebuild()
             asyncio.create_task(self.built())
-        self.resize(rect.size)
-        self.reposition(rect)
+        self.fit(rect.size)
+        self.place(rect)
+
+    def damage(self):
+        """
+        Marks this view as needing to be drawn again, without redrawing the rest of the
+        window.
+        """
+        window = self.window
+        if window is not None:
+            window.damage(self.frame)
+            window.layers.stale(self)
 
     def render(self, renderer):
+        if self.rasterized:
+            window = self.window
+            if window is not None and window.layers.render(self):
+                return
+        self.draw_tree(renderer)
+
+    def draw_tree(self, renderer):
+        """
+        Draws this view and everything inside it.
+        """
         inner = self.frame - self.env.padding - self.env.border
-        self.draw(renderer, inner)
+        if View.damaged is None or View.damaged.intersects(self.frame):
+            self.draw(renderer, inner)
         frame_check = self.parent.frame if self.parent else self.frame
         for view in self.subviews:
             # Presumably all our subviews will be contained in our frame, but checking
@@ -415,6 +608,24 @@ class View(EnvironmentalView):
     def modify(self, mod):
         return mod(self)
 
+    def rasterize(self, enabled=True):
+        """
+        Draws this view (and everything inside it) into a texture that is re-used until
+        something inside it changes. Useful for large parts of the interface that rarely
+        change, but costs memory, so should be used sparingly.
+        """
+        self.rasterized = bool(enabled)
+        return self
+
+    def key(self, value):
+        """
+        Identifies this view among its siblings, so it is matched with its previous
+        instance when rebuilding even if it moves.
+        """
+        self._key = value
+        self._id = self._id_path = None
+        return self
+
     def item(self, label_or_view):
         if isinstance(label_or_view, View):
             self.item_view = label_or_view
@@ -519,23 +730,40 @@ class View(EnvironmentalView):
     # State management.
 
     def state_changed(self, name, value):
-        # self.window.bouncer.on_next(self)
-        self.handle_state_change()
+        # Let the window coalesce changes, so the view is only rebuilt once per frame.
+        window = self.window
+        if window is None:
+            self.handle_state_change()
+        else:
+            window.state_changed(self)
 
     def handle_state_change(self):
+        self.invalidate()
+        self.damage()
         self.rebuild()
         asyncio.create_task(self.updated())
-        # self.window.needs_layout = True
-        self.layout(self.frame)
-        self.window.needs_render = True
+        window = self.window
+        if window is None:
+            # Not in a window (e.g. in a menu, or removed), so lay it out in place.
+            self.layout(self.frame.copy())
+        else:
+            window.invalidate(self)
+            window.needs_render = True
 
 
 class ForEach(View):
-    def __init__(self, items, builder):
+    def __init__(self, items, builder, key=None):
         super().__init__(items=items, builder=builder)
         self._has_index = len(inspect.signature(builder).parameters) == 2
+        self._key_func = key
 
     def __iter__(self):
         for idx, item in enumerate(self.items):
             args = [item, idx] if self._has_index else [item]
-            yield from self.builder(*args)
+            if self._key_func is None:
+                yield from self.builder(*args)
+                continue
+            key = self._key_func(item)
+            views = list(self.builder(*args))
+            for num, view in enumerate(views):
+                yield view.key(key if len(views) == 1 else (key, num))
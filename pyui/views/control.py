@@ -2,7 +2,9 @@ import asyncio
 import ctypes
 
 import sdl2
+from sdl2.sdlgfx import boxRGBA
 
+from pyui.font import TextLayout
 from pyui.geom import Insets, Rect, Size
 from pyui.state import Binding
 from pyui.utils import clamp, enumerate_last
@@ -189,7 +191,10 @@ class TextField(View):
         self.action = action
         self._start = None
         self._end = None
-        self._line_cache = None
+        # Where typed text is inserted, or None to insert at the end of the text.
+        self._cursor = None
+        # The text laid out at the widths it was last measured and drawn at.
+        self._layouts = {}
 
     @property
     def _font(self):
@@ -199,11 +204,25 @@ class TextField(View):
     def selection(self):
         if self._start is None or self._end is None:
             return None
-        return set(range(min(self._start, self._end), max(self._start, self._end) + 1))
+        return range(min(self._start, self._end), max(self._start, self._end) + 1)
 
     def text_representation(self):
         return self.text.value
 
+    def text_layout(self, width):
+        """
+        Returns a TextLayout of the text at the given width, only laying out the
+        paragraphs that changed since it was last laid out at that width.
+        """
+        font = self._font
+        layout = self._layouts.get(width)
+        if layout is None or layout.font is not font:
+            if len(self._layouts) > 1:
+                self._layouts.pop(next(iter(self._layouts)))
+            layout = self._layouts[width] = TextLayout(font, width)
+        layout.update(self.text_representation())
+        return layout
+
     def minimum_size(self):
         size = self._font.measure(self.placeholder)
         return Size(size.w, size.h * max(1, self.env.lines))
@@ -212,66 +231,121 @@ class TextField(View):
         if self.env.lines > 0:
             h = self._font.line_height * self.env.lines
         else:
-            size = self._font.measure(self.text.value, width=available.w)
-            h = max(size.h, available.h)
-        # TODO: be smarter about when to invalidate this
-        self._line_cache = None
+            h = max(self.text_layout(available.w).size.h, available.h)
         return Size(available.w, h)
 
     def draw(self, renderer, rect):
         super().draw(renderer, rect)
         self.env.draw(renderer, "textfield", self.frame)
+        layout = self.text_layout(rect.width)
         if self.text.value:
-            self._line_cache = self._font.draw(
+            self._font.draw(
                 renderer,
-                self.text_representation(),
+                layout.text,
                 rect,
                 self.env.color,
                 selected=self.selection,
-                lines=self._line_cache,
+                lines=layout.lines,
             )
         elif self.placeholder:
             self._font.draw(
                 renderer, self.placeholder, rect, sdl2.SDL_Color(150, 150, 150)
             )
+        if self.window and self.window.focus == self.id_path:
+            # Draw the caret.
+            x, row = layout.caret(self.cursor)
+            top = rect.top + row * self._font.line_height
+            color = self.env.color
+            boxRGBA(
+                renderer,
+                rect.left + x,
+                top,
+                rect.left + x + self.env.scaled(1) - 1,
+                top + self._font.line_height - 1,
+                color.r,
+                color.g,
+                color.b,
+                color.a,
+            )
+
+    @property
+    def cursor(self):
+        length = len(self.text.value)
+        return length if self._cursor is None else clamp(self._cursor, 0, length)
+
+    def move(self, cursor):
+        self._cursor = cursor
+        self._start = None
+        self._end = None
+        self.damage()
+
+    def insert(self, text):
+        """
+        Inserts text at the cursor, replacing the selection if there is one, and moves
+        the cursor after it.
+        """
+        value = self.text.value
+        if self._start is not None and self._end is not None:
+            start = min(self._start, self._end)
+            end = max(self._start, self._end) + 1
+        else:
+            start = end = self.cursor
+        if self._cursor is not None or end < len(value):
+            self._cursor = start + len(text)
+        self._start = None
+        self._end = None
+        self.text.value = value[:start] + text + value[end:]
 
     async def focus(self):
         sdl2.SDL_StartTextInput()
         sdl2.SDL_SetTextInputRect(ctypes.byref(self.frame.sdl))
+        self.damage()
 
     async def blur(self):
         sdl2.SDL_StopTextInput()
+        self.damage()
 
     async def keydown(self, key, mods):
         if key == sdl2.SDLK_BACKSPACE:
             if self._start is not None and self._end is not None:
-                s = min(self._start, self._end)
-                e = max(self._start, self._end)
-                self.text.value = self.text.value[:s] + self.text.value[e:]
-                self._start = None
-                self._end = None
-            else:
-                self.text.value = self.text.value[:-1]
+                self.insert("")
+            elif self.cursor > 0:
+                self._start = self._end = self.cursor - 1
+                self.insert("")
         elif key == sdl2.SDLK_RETURN:
             if self.env.lines == 1:
                 call_action(self.action, self.text.value)
             else:
-                self.text.value = self.text.value + "\n"
+                self.insert("\n")
+        elif key == sdl2.SDLK_LEFT:
+            self.move(max(0, self.cursor - 1))
+        elif key == sdl2.SDLK_RIGHT:
+            self.move(min(len(self.text.value), self.cursor + 1))
+        elif key == sdl2.SDLK_HOME:
+            self.move(0)
+        elif key == sdl2.SDLK_END:
+            self.move(None)
 
     async def textinput(self, text):
-        self.text.value = self.text.value + text
+        self.insert(text)
 
     async def mousedown(self, pt):
         inner = self.frame - self.env.padding - self.env.border
-        self._start = self._font.find(
-            self.text.value, inner, pt, lines=self._line_cache
-        )
+        lines = self.text_layout(inner.width).lines
+        found = self._font.locate(self.text.value, inner, pt, lines=lines)
+        self._start = None
         self._end = None
+        if found is not None:
+            idx, code, x, kern, extent = found
+            self._start = idx
+            # Put the cursor before or after the character, whichever is closer.
+            self._cursor = idx + 1 if pt.x > inner.left + (x + extent) // 2 else idx
         return self._start is not None
 
     async def mousemotion(self, pt):
         inner = self.frame - self.env.padding - self.env.border
-        idx = self._font.find(self.text.value, inner, pt, lines=self._line_cache)
+        lines = self.text_layout(inner.width).lines
+        idx = self._font.find(self.text.value, inner, pt, lines=lines)
         if idx is not None:
             self._end = idx
 
@@ -51,7 +51,7 @@ class Grid(View):
         main = self.spacing[self.axis] * (len(self.subviews) - 1)
         cross = 0
         for view in self.subviews:
-            min_size = view.minimum_size()
+            min_size = view.measure()
             main += (
                 min_size[self.axis]
                 + view.env.padding[self.axis]
@@ -111,7 +111,7 @@ class Grid(View):
                 main += self.spacing[self.axis]
             max_main = 0
             for view in views:
-                view.resize(self.axis.size(main_offer, cross_offer))
+                view.fit(self.axis.size(main_offer, cross_offer))
                 max_main = max(max_main, view.frame.size[self.axis])
             main += max_main
         self.frame.size = self.axis.size(main, available[self.cross])
@@ -133,7 +133,7 @@ class Grid(View):
             for idx, view in enumerate(views):
                 if idx > 0:
                     cross += self.spacing[self.cross]
-                view.reposition(
+                view.place(
                     Rect(
                         origin=self.axis.point(main, cross),
                         size=view.frame.size,
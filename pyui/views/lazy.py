@@ -0,0 +1,230 @@
+import inspect
+from array import array
+
+from pyui.geom import Axis, Rect, Size
+
+from .base import View
+from .scroll import ScrollView
+
+
+class Extents:
+    """
+    Tracks the sizes of a run of rows along one axis, where any rows that haven't been
+    measured are assumed to be the estimated size. Measured sizes are kept in a Fenwick
+    tree of differences from the estimate, so finding the offset of a row (or the row at
+    an offset) takes O(log n) time, no matter how many rows there are.
+    """
+
+    def __init__(self, count, estimate, spacing=0):
+        self.count = count
+        self.estimate = estimate
+        self.spacing = spacing
+        self.sizes = {}
+        # Allocated the first time a row is measured.
+        self.tree = None
+
+    def __getitem__(self, idx):
+        return self.sizes.get(idx, self.estimate)
+
+    def __setitem__(self, idx, size):
+        delta = size - self.sizes.get(idx, self.estimate)
+        self.sizes[idx] = size
+        if not delta:
+            return
+        if self.tree is None:
+            self.tree = array("q", bytes(8 * (self.count + 1)))
+        pos = idx + 1
+        while pos <= self.count:
+            self.tree[pos] += delta
+            pos += pos & -pos
+
+    @property
+    def total(self):
+        if not self.count:
+            return 0
+        return self.offset(self.count) - self.spacing
+
+    def offset(self, idx):
+        """
+        Returns the offset of the leading edge of the row at idx.
+        """
+        offset = idx * (self.estimate + self.spacing)
+        if self.tree is not None:
+            while idx > 0:
+                offset += self.tree[idx]
+                idx -= idx & -idx
+        return offset
+
+    def find(self, offset):
+        """
+        Returns the index of the row at the given offset, clamped to the valid rows.
+        """
+        if not self.count:
+            return 0
+        unit = self.estimate + self.spacing
+        idx = 0
+        step = 1 << self.count.bit_length()
+        while step:
+            if idx + step <= self.count:
+                span = step * unit
+                if self.tree is not None:
+                    span += self.tree[idx + step]
+                if span <= offset:
+                    idx += step
+                    offset -= span
+            step >>= 1
+        return min(idx, self.count - 1)
+
+
+class LazyStack(View):
+    """
+    Lays out one row per item like a Stack, but only builds and lays out the rows that
+    are visible in the enclosing ScrollView (plus an overscan margin on either side).
+    Rows that have not been built are assumed to be the same size as the estimate, or
+    the first row if no estimate is given. Items must support len() and indexing.
+    """
+
+    axis = None
+
+    def __init__(
+        self,
+        items,
+        builder,
+        estimate=None,
+        overscan=100,
+        alignment=None,
+        spacing=None,
+        **options
+    ):
+        # Whether the builder takes the index too, checked once rather than per row. It
+        # isn't local state, so it is updated along with the builder when re-used.
+        super().__init__(
+            items=items,
+            builder=builder,
+            indexed=len(inspect.signature(builder).parameters) == 2,
+            **options
+        )
+        self.cross = self.axis.cross
+        self.estimate = self.env.scaled(estimate)
+        self.overscan = self.env.scaled(overscan)
+        if alignment is not None:
+            self.alignment(alignment)
+        if spacing is not None:
+            self.spacing(spacing)
+        # Local state, not overwritten when re-using the view.
+        self._extents = None
+
+    def build(self, idx):
+        if self.indexed:
+            return self.builder(self.items[idx], idx)
+        return self.builder(self.items[idx])
+
+    def rebuild(self):
+        old = {v.id_path: v for v in self.subviews}
+        self.invalidate()
+        count = len(self.items)
+        if self._extents is not None and self._extents.count != count:
+            self._extents = Extents(count, self._extents.estimate, self.env.spacing)
+        self._subviews = [
+            self.attach(self.build(view.index), view.index, old)
+            for view in self.subviews
+            if view.index < count
+        ]
+        self.detach(old.values())
+
+    def row_offer(self, view, cross):
+        return self.axis.size(
+            view.measure()[self.axis]
+            + view.env.padding[self.axis]
+            + view.env.border[self.axis],
+            cross,
+        )
+
+    def materialize(self, first, last, cross):
+        """
+        Builds and sizes the rows from first to last (inclusive), removing any other
+        rows. Returns True if any new rows were measured.
+        """
+        old = {v.index: v for v in self.subviews}
+        rows = []
+        measured = False
+        for idx in range(first, last + 1):
+            view = old.pop(idx, None)
+            if view is None:
+                view = self.attach(self.build(idx), idx, {})
+                view.fit(self.row_offer(view, cross))
+                if view.frame.size[self.axis] != self._extents[idx]:
+                    measured = True
+                self._extents[idx] = view.frame.size[self.axis]
+            rows.append(view)
+        self._subviews = rows
+        self.detach(old.values())
+        return measured
+
+    def resize(self, available: Size):
+        available = self.env.constrain(available)
+        cross = (
+            available[self.cross]
+            - self.env.padding[self.cross]
+            - self.env.border[self.cross]
+        )
+        if self._extents is None:
+            estimate = self.estimate or 0
+            if len(self.items) and not estimate:
+                # Use the first row as the estimate for all the others.
+                view = self.attach(self.build(0), 0, {})
+                view.fit(self.row_offer(view, cross))
+                estimate = view.frame.size[self.axis]
+                self._subviews = [view]
+            self._extents = Extents(len(self.items), estimate, self.env.spacing)
+        for view in self.subviews:
+            view.fit(self.row_offer(view, cross))
+            self._extents[view.index] = view.frame.size[self.axis]
+        self.frame.size = self.axis.size(
+            self._extents.total
+            + self.env.padding[self.axis]
+            + self.env.border[self.axis],
+            available[self.cross],
+        )
+        return self.axis.size(self._extents.total, cross)
+
+    def viewport(self):
+        view = self.parent
+        while view and not isinstance(view, ScrollView):
+            view = view.parent
+        if view is None:
+            return self.root.frame
+        return view.frame - view.env.padding - view.env.border
+
+    def reposition(self, inside: Rect):
+        self.position_inside(inside)
+        inner = self.frame - self.env.padding - self.env.border
+        viewport = self.viewport()
+        start = viewport.origin[self.axis] - inner.origin[self.axis] - self.overscan
+        end = start + viewport.size[self.axis] + self.overscan * 2
+        if self._extents.count and self.materialize(
+            self._extents.find(max(0, start)),
+            self._extents.find(max(0, end)),
+            inner.size[self.cross],
+        ):
+            # Newly built rows were not the estimated size, so the overall size needs
+            # to be recalculated (and our parent, i.e. ScrollView, laid out again).
+            self.invalidate()
+            window = self.window
+            if window is not None:
+                window.invalidate(self)
+        for view in self.subviews:
+            main = inner.origin[self.axis] + self._extents.offset(view.index)
+            cross = inner.origin[self.cross] + int(
+                self.env.alignment.value
+                * (inner.size[self.cross] - view.frame.size[self.cross])
+            )
+            view.place(Rect(origin=self.axis.point(main, cross), size=view.frame.size))
+
+
+class LazyHStack(LazyStack):
+    axis = Axis.HORIZONTAL
+
+
+class LazyVStack(LazyStack):
+    axis = Axis.VERTICAL
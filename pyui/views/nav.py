@@ -36,11 +36,13 @@ class List(VStack):
     interactive = True
     draws_focus = False
 
-    def __init__(self, items=None, builder=None, selection: Binding = None, **options):
+    def __init__(
+        self, items=None, builder=None, selection: Binding = None, key=None, **options
+    ):
         self.selection = selection
         contents = []
         if items is not None:
-            contents.append(ForEach(items, builder or self.default_builder))
+            contents.append(ForEach(items, builder or self.default_builder, key=key))
         super().__init__(*contents, spacing=0, alignment=Alignment.LEADING, **options)
 
     def default_builder(self, item):
@@ -66,6 +68,8 @@ class List(VStack):
         )
         if self.selection and self.selection.value and index in self.selection.value:
             wrapped.background(200, 200, 255, 16)
+        if item._key is not None:
+            wrapped.key(item._key)
         return wrapped
 
     def content_size(self, available: Size):
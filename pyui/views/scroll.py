@@ -97,6 +97,8 @@ class ScrollView(View):
         return self.scroll_size
 
     def reposition(self, inside: Rect):
+        # Subviews (e.g. LazyStack) find what is visible from this frame when placed.
+        self.frame.origin = inside.origin
         # Account for scrollbars.
         bars = Insets()
         if self.axis in (Axis.VERTICAL, None):
@@ -107,9 +109,8 @@ class ScrollView(View):
         for view in self.subviews:
             scrolled = adjusted.scroll(self._position)
             # view.frame.origin = scrolled.origin
-            view.reposition(scrolled)
+            view.place(scrolled)
             view.frame.origin = scrolled.origin
-        self.frame.origin = inside.origin
 
     def set_position(self, axis, pos=None):
         delta = max(0, self.scroll_size[axis] - self.frame.size[axis])
@@ -154,7 +155,11 @@ class ScrollView(View):
         # This is overridden so we can clip rendering to the visible bounds, and so we
         # can draw our scrollbars last.
         inner = self.frame - self.env.padding - self.env.border
-        sdl2.SDL_RenderSetClipRect(renderer, ctypes.byref(inner.sdl))
+        # Only redrawing part of the window, which is already clipped.
+        clip = inner if View.damaged is None else inner.intersection(View.damaged)
+        if clip is None:
+            return
+        sdl2.SDL_RenderSetClipRect(renderer, ctypes.byref(clip.sdl))
         for view in self.subviews:
             if self.frame.intersects(view.frame):
                 view.render(renderer)
@@ -162,7 +167,8 @@ class ScrollView(View):
         # sdl2.SDL_RenderSetClipRect(renderer, None)
         # Setting the clip rect to None/NULL work on OSX, but does strange things on
         # Windows. This is a hack, but seems to work.
-        sdl2.SDL_RenderSetClipRect(renderer, ctypes.byref(self.root.frame.sdl))
+        restore = self.root.frame if View.damaged is None else View.damaged
+        sdl2.SDL_RenderSetClipRect(renderer, ctypes.byref(restore.sdl))
 
     def draw(self, renderer, rect):
         super().draw(renderer, rect)
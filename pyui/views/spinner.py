@@ -34,4 +34,4 @@ class Spinner(View):
             shade = 80 + (((idx - (self.step // 4)) % self.lines) * 6)
             thickLineRGBA(renderer, x1, y1, x2, y2, width, shade, shade, shade, 200)
         self.step += 1
-        self.window.needs_render = True
+        self.damage()
@@ -1,3 +1,5 @@
+import itertools
+
 from pyui.geom import Axis, Priority, Rect, Size
 
 from .base import View
@@ -27,6 +29,17 @@ class Stack(View):
         if spacing is not None:
             self.spacing(spacing)
 
+    def main_minimum(self, view):
+        """
+        Returns the minimum size of a subview along the layout axis, including its
+        padding and borders.
+        """
+        return (
+            view.measure()[self.axis]
+            + view.env.padding[self.axis]
+            + view.env.border[self.axis]
+        )
+
     def minimum_size(self):
         """
         Returns the minimum size in each dimension of this view's content, not including
@@ -35,7 +48,7 @@ class Stack(View):
         main = self.env.spacing * (len(self.subviews) - 1)
         cross = 0
         for view in self.subviews:
-            min_size = view.minimum_size()
+            min_size = view.measure()
             main += (
                 min_size[self.axis]
                 + view.env.padding[self.axis]
@@ -69,41 +82,37 @@ class Stack(View):
         )
         # The maximum amount of space on the cross axis any subview occupies.
         max_cross = 0
-        # Group our subviews by priority, and calculate the minimum total size along our
-        # axis for each group.
-        groups = {}
-        mins = {}
-        for view in self.subviews:
-            min_size = view.minimum_size()
-            mins[view] = (
-                min_size[self.axis]
-                + view.env.padding[self.axis]
-                + view.env.border[self.axis]
-            )
-            groups.setdefault(view.env.priority, {"minimum": 0, "views": []})
-            groups[view.env.priority]["minimum"] += mins[view]
-            groups[view.env.priority]["views"].append(view)
+        # Gather the minimum size of each subview along our axis, and order them by
+        # priority (keeping their original order within each priority).
+        views = self.subviews
+        mins = [self.main_minimum(view) for view in views]
+        priorities = [view.env.priority for view in views]
+        order = sorted(range(len(views)), key=priorities.__getitem__, reverse=True)
         # Starting with the highest priority views, offer them an even split of the
         # remaining available space along the layout axis, reserving enough space for
         # the minimal sizes of all views with lower priority.
-        for priority in sorted(groups, reverse=True):
-            reserved = sum(groups[p]["minimum"] for p in groups if p < priority)
-            views = groups[priority]["views"]
+        reserved = sum(mins)
+        for priority, group in itertools.groupby(order, key=priorities.__getitem__):
+            group = list(group)
+            reserved -= sum(mins[idx] for idx in group)
+            count = len(group)
             # TODO: sort views within a priority by whether they have fixed sizes?
-            for idx, view in enumerate(views):
+            for num, idx in enumerate(group):
+                view = views[idx]
                 # Take the remaining unreserved space, and divide it by how many views
                 # are left in this group. Always offer at least the view's minimal space
                 # along the primary axis.
                 offer = self.axis.size(
-                    max(mins[view], int((remaining - reserved) / (len(views) - idx))),
+                    max(mins[idx], int((remaining - reserved) / (count - num))),
                     available_cross,
                 )
                 # Offer the view some amount of space, let it decide how much it wants.
-                view.resize(offer)
+                view.fit(offer)
                 # TODO: should we verify this is less than or equal to what was offered?
-                total += view.frame.size[self.axis]
-                remaining -= view.frame.size[self.axis]
-                max_cross = max(max_cross, view.frame.size[self.cross])
+                size = view.frame.size
+                total += size[self.axis]
+                remaining -= size[self.axis]
+                max_cross = max(max_cross, size[self.cross])
         self.frame.size = self.axis.size(
             total,
             max_cross + self.env.padding[self.cross] + self.env.border[self.cross],
@@ -125,7 +134,7 @@ class Stack(View):
                 self.env.alignment.value
                 * (inner.size[self.cross] - view.frame.size[self.cross])
             )
-            view.reposition(
+            view.place(
                 Rect(origin=self.axis.point(current, cross), size=view.frame.size)
             )
             current += view.frame.size[self.axis]
@@ -1,7 +1,7 @@
-import json
 import os
 
 from pyui.geom import Size
+from pyui.icons import IconIndex
 
 from .base import View
 
@@ -46,10 +46,11 @@ class Text(View):
 
 
 class Icon(Text):
-    data = json.load(open(os.path.join(DATA_DIR, "icons.json")))
+    # Compiled from icons.json, see pyui.icons.
+    index = IconIndex(os.path.join(DATA_DIR, "icons.idx"))
 
     def __init__(self, name, style=None, size=None):
-        info = Icon.data["icons"][name]
-        fontname = "{}/{}.otf".format(Icon.data["font"], style or info["sets"][0])
-        super().__init__(info["text"])
+        info = Icon.index[name]
+        fontname = "{}/{}.otf".format(Icon.index.font, style or info.sets[0])
+        super().__init__(info.text)
         self.font(fontname, size)
@@ -1,9 +1,61 @@
+import asyncio
+import collections
+import contextlib
+import ctypes
+import os
+import random
+import tempfile
+import types
 import unittest
+from unittest import mock
 
+import sdl2
+
+from pyui import layers
+from pyui.app import Application
 from pyui.env import Environment
-from pyui.font import Font
-from pyui.geom import Insets, Point, Rect, Size
+from pyui.font import Font, TextLayout
+from pyui.geom import Axis, Insets, Point, Priority, Rect, Size
+from pyui.icons import IconIndex, compile_index
+from pyui.spatial import SpatialIndex
+from pyui.state import State
 from pyui.utils import enumerate_last
+from pyui.views import (
+    Button,
+    ForEach,
+    HStack,
+    LazyVStack,
+    Rectangle,
+    ScrollView,
+    Spacer,
+    Text,
+    View,
+    VStack,
+)
+from pyui.views.lazy import Extents
+from pyui.views.text import DATA_DIR
+
+
+@contextlib.contextmanager
+def software_renderer(width, height):
+    """
+    Yields a renderer that draws into a surface, and a function returning its pixels.
+    """
+    surface = sdl2.SDL_CreateRGBSurfaceWithFormat(
+        0, width, height, 32, sdl2.SDL_PIXELFORMAT_ARGB8888
+    )
+    renderer = sdl2.SDL_CreateSoftwareRenderer(surface)
+
+    def pixels():
+        contents = surface.contents
+        return ctypes.string_at(contents.pixels, contents.pitch * height)
+
+    try:
+        yield renderer, pixels
+    finally:
+        Font.release_renderer(renderer)
+        sdl2.SDL_DestroyRenderer(renderer)
+        sdl2.SDL_FreeSurface(surface)
 
 
 class MeasurementTests(unittest.TestCase):
@@ -16,6 +68,13 @@ class MeasurementTests(unittest.TestCase):
         self.assertEqual(r3.origin, Point(110, 110))
         self.assertEqual(r3.size, Size(130, 30))
 
+    def test_rect_union_intersection(self):
+        r1 = Rect(origin=(0, 0), size=(100, 50))
+        r2 = Rect(origin=(50, 25), size=(100, 50))
+        self.assertEqual(r1.union(r2), Rect(origin=(0, 0), size=(150, 75)))
+        self.assertEqual(r1.intersection(r2), Rect(origin=(50, 25), size=(50, 25)))
+        self.assertIsNone(r1.intersection(Rect(origin=(100, 0), size=(10, 10))))
+
     def test_enumerate_last(self):
         values = list(enumerate_last([100, 200, 300]))
         self.assertEqual(values, [(0, 100, False), (1, 200, False), (2, 300, True)])
@@ -31,6 +90,519 @@ class EnvironmentTests(unittest.TestCase):
         self.assertEqual(child.font_size, 24)
 
 
+class FontTests(unittest.TestCase):
+    def test_measure_cache(self):
+        Font.initialize(1.0)
+        font = Font("dejavu/DejaVuSans.ttf", 12)
+        font.measure_limit = 20
+        size, lines = font.lines("Hello world", 40)
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(font.measure("Hello world", 40), size)
+        self.assertEqual((font.hits, font.misses), (1, 1))
+        self.assertIs(font.lines("Hello world", 40)[1], lines)
+        font.measure("Goodbye world", 40)
+        self.assertNotIn(("Hello world", 40, True, True), font.measured)
+
+    def test_single_line(self):
+        Font.initialize(1.0)
+        font = Font("dejavu/DejaVuSans.ttf", 12)
+        for text in ("", "AVA To", "\x01Wa\tter", "Hello world"):
+            for width, kerning, wrap in ((None, True, True), (40, False, False)):
+                self.assertEqual(
+                    font.measure(text, width, kerning, wrap),
+                    font.lines(text, width or 2**14, kerning, wrap)[0],
+                )
+        # None of these needed laying out to measure.
+        self.assertEqual(font.hits, 0)
+
+    def test_selection_blend_mode(self):
+        Font.initialize(1.0)
+        font = Font("dejavu/DejaVuSans.ttf", 12)
+        with software_renderer(100, 20) as (renderer, pixels):
+            sdl2.SDL_SetRenderDrawBlendMode(renderer, sdl2.SDL_BLENDMODE_BLEND)
+            color = sdl2.SDL_Color(0, 0, 0)
+            font.draw(renderer, "Hello", Rect(size=(100, 20)), color, range(1, 3))
+            # Highlighting the selection doesn't leave later drawing adding colors.
+            mode = sdl2.SDL_BlendMode()
+            sdl2.SDL_GetRenderDrawBlendMode(renderer, ctypes.byref(mode))
+            self.assertEqual(mode.value, sdl2.SDL_BLENDMODE_BLEND)
+
+    def test_eviction(self):
+        Font.initialize(1.0)
+        rect = Rect(size=(100, 20))
+        color = sdl2.SDL_Color(255, 255, 255)
+        cache = mock.patch.object(Font, "cache", collections.OrderedDict())
+        with cache, mock.patch.object(Font, "budget", 1):
+            with software_renderer(100, 20) as (renderer, pixels):
+                first = Font.load("dejavu/DejaVuSans.ttf", 12)
+                first.draw(renderer, "Evicted", rect, color)
+                self.assertGreater(first.memory, 0)
+                # Over budget, so the least recently used font is evicted and freed.
+                Font.load("dejavu/DejaVuSans.ttf", 13)
+                self.assertEqual(list(Font.usage()), ["dejavu/DejaVuSans.ttf-13"])
+                self.assertEqual(first.memory, 0)
+                # It can still be drawn with, and the glyphs it loads again are freed
+                # along with the renderer.
+                first.draw(renderer, "Evicted", rect, color)
+                self.assertGreater(first.memory, 0)
+                Font.release_renderer(renderer)
+                self.assertEqual(first.memory, 0)
+                # Over its glyph budget, a font frees its glyphs after drawing them.
+                first.glyph_budget = 1
+                sdl2.SDL_SetRenderDrawColor(renderer, 0, 0, 0, 0)
+                sdl2.SDL_RenderClear(renderer)
+                self.assertFalse(any(pixels()))
+                first.draw(renderer, "Trimmed", rect, color)
+                self.assertEqual(first.memory, 0)
+                self.assertTrue(any(pixels()))
+
+    def test_text_layout(self):
+        Font.initialize(1.0)
+        font = Font("dejavu/DejaVuSans.ttf", 12)
+        layout = TextLayout(font, 60)
+        text = "First paragraph\nSecond one\n\nThird"
+        for edit in (text, text.replace("Second", "2nd"), "Zeroth\n" + text, "", "\n"):
+            self.assertEqual(layout.update(edit), list(font.layout(edit, 60)))
+            self.assertEqual(layout.size, font.measure(edit, 60))
+        layout.update("ab\ncd")
+        self.assertEqual(layout.caret(0), (0, 0))
+        self.assertEqual(layout.caret(3), (0, 1))
+        self.assertEqual(layout.caret(5)[1], 1)
+
+
+class IconTests(unittest.TestCase):
+    def test_index(self):
+        index = IconIndex(os.path.join(DATA_DIR, "icons.idx"))
+        self.assertEqual(index["500px"], ("\uf26e", ["brands"]))
+        self.assertEqual(index["zhihu"].sets, ["brands"])
+        self.assertNotIn("missing", index)
+        with self.assertRaises(KeyError):
+            index[""]
+        # The bundled index is up to date with icons.json.
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "icons.idx")
+            compile_index(os.path.join(DATA_DIR, "icons.json"), path)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), index.load())
+
+
+class ExtentsTests(unittest.TestCase):
+    def test_offsets(self):
+        extents = Extents(1000, 20, spacing=2)
+        self.assertEqual(extents.total, 1000 * 22 - 2)
+        extents[10] = 50
+        extents[500] = 0
+        self.assertEqual(extents.offset(10), 220)
+        self.assertEqual(extents.offset(11), 220 + 52)
+        self.assertEqual(extents.offset(501), 501 * 22 + 30 - 20)
+        self.assertEqual(extents.total, 1000 * 22 - 2 + 30 - 20)
+        for idx in (0, 9, 10, 11, 499, 500, 501, 999):
+            self.assertEqual(extents.find(extents.offset(idx)), idx)
+            self.assertEqual(extents.find(extents.offset(idx) + 1), idx)
+        self.assertEqual(extents.find(10**9), 999)
+
+    def test_layout_outside_window(self):
+        async def run():
+            Font.initialize(1.0)
+            stack = LazyVStack(range(10), lambda n: Text("Row\n" * (n % 3 + 1)))
+            stack.rebuild()
+            # Without padding or a border, the content size is the frame size.
+            self.assertEqual(stack.resize(Size(200, 300)), stack.frame.size)
+            stack.layout(Rect(size=(200, 300)))
+            # Rows taller than the estimate were measured, without a window to tell.
+            self.assertGreater(stack._extents.total, 10 * stack._extents.estimate)
+
+        asyncio.run(run())
+
+
+class ReconciliationTests(unittest.TestCase):
+    def test_keyed_move(self):
+        async def rebuild(items):
+            root.contents = (ForEach(items, lambda i: (View(value=i),), key=str),)
+            root.rebuild()
+            return {v.value: v for v in root.subviews}
+
+        root = View()
+        before = asyncio.run(rebuild([1, 2, 3]))
+        after = asyncio.run(rebuild([3, 1, 2]))
+        for value, view in before.items():
+            self.assertIs(after[value], view)
+        self.assertEqual([v.index for v in root.subviews], [0, 1, 2])
+        self.assertEqual(root.subviews[0].id, "View['3']")
+
+    def test_update_unchanged(self):
+        class Form(View):
+            name = State(str, default="")
+            other = State(str, default="")
+
+        form = Form()
+
+        def field(binding):
+            return View(binding=binding, insets=Insets(2)).color(10, 20, 30).padding(3)
+
+        view = field(form.name)
+        with mock.patch.object(view, "invalidate") as invalidate:
+            # Rebuilt with new, but equal, bindings, insets, and environments.
+            view.update(field(form.name))
+            invalidate.assert_not_called()
+            view.update(field(form.other))
+            invalidate.assert_called_once()
+        # The values compared are still hashable.
+        self.assertEqual(len({Insets(2), Insets(2), Environment()}), 3)
+
+    def test_update_incomparable(self):
+        class Elements(list):
+            def __ne__(self, other):
+                # Like a NumPy array, compares element-wise rather than to a bool.
+                return Elements(a != b for a, b in zip(self, other))
+
+            def __bool__(self):
+                raise ValueError("ambiguous")
+
+        view = View(values=Elements([1, 2]))
+        view.update(View(values=Elements([1, 3])))
+        self.assertEqual(view.values, [1, 3])
+
+
+class SpatialIndexTests(unittest.TestCase):
+    def test_find(self):
+        def view(x, y, w, h, *subviews, **options):
+            v = View(**options)
+            v.frame = Rect(origin=(x, y), size=(w, h))
+            v._subviews = list(subviews)
+            for sub in subviews:
+                sub.parent = v
+            return v
+
+        # The last subview extends outside its parent, so it is clipped.
+        root = view(
+            0,
+            0,
+            300,
+            200,
+            view(10, 10, 100, 100, view(20, 20, 10, 10, interactive=True)),
+            view(50, 50, 200, 200, interactive=True),
+        )
+        index = SpatialIndex(root, ("interactive",), cell=32)
+        for x in range(-5, 310, 5):
+            for y in range(-5, 260, 5):
+                pt = Point(x, y)
+                self.assertIs(index.find(pt), root.find(pt))
+                self.assertIs(
+                    index.find(pt, "interactive"), root.find(pt, interactive=True)
+                )
+
+
+class BaselineHStack(HStack):
+    def resize(self, available: Size):
+        # How Stack.resize allocated space before it was optimized, to compare against.
+        total = (
+            self.env.padding[self.axis]
+            + self.env.border[self.axis]
+            + (self.env.spacing * (len(self.subviews) - 1))
+        )
+        available = self.env.constrain(available)
+        remaining = available[self.axis] - total
+        available_cross = (
+            available[self.cross]
+            - self.env.padding[self.cross]
+            - self.env.border[self.cross]
+        )
+        max_cross = 0
+        groups = {}
+        mins = {}
+        for view in self.subviews:
+            min_size = view.measure()
+            mins[view] = (
+                min_size[self.axis]
+                + view.env.padding[self.axis]
+                + view.env.border[self.axis]
+            )
+            groups.setdefault(view.env.priority, {"minimum": 0, "views": []})
+            groups[view.env.priority]["minimum"] += mins[view]
+            groups[view.env.priority]["views"].append(view)
+        for priority in sorted(groups, reverse=True):
+            reserved = sum(groups[p]["minimum"] for p in groups if p < priority)
+            views = groups[priority]["views"]
+            for idx, view in enumerate(views):
+                offer = self.axis.size(
+                    max(mins[view], int((remaining - reserved) / (len(views) - idx))),
+                    available_cross,
+                )
+                view.fit(offer)
+                total += view.frame.size[self.axis]
+                remaining -= view.frame.size[self.axis]
+                max_cross = max(max_cross, view.frame.size[self.cross])
+        self.frame.size = self.axis.size(
+            total,
+            max_cross + self.env.padding[self.cross] + self.env.border[self.cross],
+        )
+
+
+class StackTests(unittest.TestCase):
+    def test_baseline(self):
+        def stack(cls, seed):
+            rng = random.Random(seed)
+            views = []
+            for _ in range(rng.randint(1, 30)):
+                kind = rng.randrange(3)
+                if kind == 0:
+                    view = Rectangle().size(width=rng.randint(0, 50) or None)
+                elif kind == 1:
+                    view = Spacer()
+                else:
+                    view = Text("x" * rng.randint(1, 20)).padding(rng.randint(0, 3))
+                views.append(view.priority(rng.choice(list(Priority))))
+            return cls(spacing=rng.randint(0, 5))(*views)
+
+        async def run():
+            Font.initialize(1.0)
+            for seed in range(300):
+                width = random.Random(seed).randint(-20, 900)
+                frames = []
+                for cls in (HStack, BaselineHStack):
+                    view = stack(cls, seed)
+                    view.layout(Rect(size=(width, 50)))
+                    frames.append([(v.frame.origin, v.frame.size) for v in walk(view)])
+                self.assertEqual(frames[0], frames[1], seed)
+
+        asyncio.run(run())
+
+
+class Row(View):
+    label = State(str, default="")
+
+    def content(self):
+        yield HStack()(
+            Text("Row {}".format(self.number)), Spacer(), Text(self.label.value)
+        )
+
+
+class Rows(View):
+    count = State(int, default=3)
+    rebuilds = 0
+
+    def rebuild(self):
+        self.rebuilds += 1
+        super().rebuild()
+
+    def content(self):
+        yield VStack()(*(Row(number=i) for i in range(self.count.value)))
+
+
+class LongList(View):
+    def content(self):
+        # The list starts well below the top of the window (and its overscan).
+        yield VStack()(
+            Text("Header\n" * 20),
+            ScrollView()(
+                LazyVStack(range(1000), lambda num: Text("Row {}".format(num)))
+            ).priority(Priority.HIGH),
+        )
+
+
+class Ticker(View):
+    draws = 0
+
+    def draw(self, renderer, rect):
+        # Animates like a Spinner, asking to be drawn again every time it is drawn.
+        super().draw(renderer, rect)
+        self.draws += 1
+        self.damage()
+
+
+class Animated(View):
+    def content(self):
+        yield VStack()(Text("Animated"), Ticker().size(width=20, height=20)).rasterize()
+
+
+class Buttons(View):
+    items = State(list, default=[1, 2, 3])
+
+    def content(self):
+        yield VStack()(
+            ForEach(self.items.value, lambda item: (Button(str(item)),), key=str)
+        )
+
+
+def walk(view):
+    yield view
+    for subview in view.subviews:
+        yield from walk(subview)
+
+
+class WindowTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Headless, where only the software renderer is available.
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_RENDER_DRIVER", "software")
+        cls.app = Application("pyui.tests")
+
+    def run_window(self, test, view=Rows, width=300, height=200):
+        async def run():
+            win = self.app.window("Test", view(), width=width, height=height)
+            try:
+                win.layout()
+                result = test(win, win.view)
+                if asyncio.iscoroutine(result):
+                    await result
+            finally:
+                self.app.windows.remove(win)
+                win.cleanup()
+
+        asyncio.run(run())
+
+    def test_unattached_state_change(self):
+        async def run():
+            view = Rows()
+            view.count.value = 2
+            self.assertEqual(len(view.subviews[0].subviews), 2)
+
+        asyncio.run(run())
+
+    def test_fit_cache(self):
+        def test(win, root):
+            hits, misses = View.fit_hits, View.fit_misses
+            root.fit(root._offer)
+            self.assertEqual((View.fit_hits, View.fit_misses), (hits + 1, misses))
+            root.subviews[0].subviews[0].invalidate()
+            root.fit(root._offer)
+            self.assertGreater(View.fit_misses, misses)
+
+        self.run_window(test)
+
+    def test_coalesced_rebuilds(self):
+        def test(win, root):
+            rebuilds = root.rebuilds
+            for count in (4, 5, 6):
+                root.count.value = count
+            self.assertEqual(root.rebuilds, rebuilds)
+            win.tick(0)
+            self.assertEqual(root.rebuilds, rebuilds + 1)
+            with win.batch():
+                with win.batch():
+                    root.count.value = 2
+                win.tick(0)
+                self.assertEqual(root.rebuilds, rebuilds + 1)
+            self.assertEqual(root.rebuilds, rebuilds + 2)
+            self.assertEqual(len(root.subviews[0].subviews), 2)
+
+        self.run_window(test)
+
+    def test_registry(self):
+        def test(win, root):
+            removed = root.subviews[0].subviews[2]
+            for count in (2, 3):
+                root.count.value = count
+                win.tick(0)
+            # Changing state on a removed view doesn't register it over the live one.
+            removed.label.value = "removed"
+            win.tick(0)
+            self.assertEqual(win.views, {v.id_path: v for v in walk(root)})
+            live = root.subviews[0].subviews[2]
+            self.assertIsNot(live, removed)
+            self.assertIs(win.resolve(live.id_path), live)
+
+        self.run_window(test)
+
+    def test_relayout(self):
+        def frames(root):
+            return {v.id_path: (v.frame.origin, v.frame.size) for v in walk(root)}
+
+        def test(win, root):
+            rng = random.Random(1)
+            for _ in range(60):
+                if rng.random() < 0.3:
+                    root.count.value = rng.randint(0, 6)
+                elif root.count.value:
+                    row = rng.choice(root.subviews[0].subviews)
+                    row.label.value = "x" * rng.randint(0, 30)
+                win.tick(0)
+                relaid = frames(root)
+                win.layout(force=True)
+                self.assertEqual(relaid, frames(root))
+
+        self.run_window(test)
+
+    def test_event_damage(self):
+        async def test(win, root):
+            row = root.subviews[0].subviews[1]
+            event = types.SimpleNamespace(x=row.frame.left + 1, y=row.frame.top + 1)
+            win.needs_render = False
+            win.damaged = []
+            await win.mousedown(event)
+            await win.mouseup(event)
+            # Nothing there is interactive, so the root view handled the click, and
+            # only it (and its focus ring) is redrawn rather than the whole window.
+            self.assertFalse(win.needs_render)
+            self.assertEqual(win.damaged, [root.frame + Insets(1)] * 2)
+
+        self.run_window(test)
+
+    def test_rasterized_damage(self):
+        def test(win, root):
+            ticker = root.subviews[0].subviews[1]
+            win.render(force=True)
+            self.assertEqual(len(win.layers), 1)
+            for draws in range(2, 5):
+                win.render()
+                self.assertEqual(ticker.draws, draws)
+
+        # The software renderer can't blend premultiplied alpha, which only changes how
+        # layers look, not when they are drawn.
+        with mock.patch.object(layers, "PREMULTIPLIED", sdl2.SDL_BLENDMODE_BLEND):
+            self.run_window(test, Animated)
+
+    def test_focus_chain(self):
+        def tabbed(win):
+            # Tabs through every view from the start, rather than the focused one.
+            win.focus = None
+            order = []
+            for _ in range(len(win.focus_chain()[0])):
+                win.advance_focus()
+                order.append(win.resolve(win.focus))
+            return order
+
+        def test(win, root):
+            chain = win.focus_chain()
+            self.assertIs(win.focus_chain(), chain)
+            for items in ([3, 1, 2], [3, 4, 1, 2], [4, 2], [2, 4, 5]):
+                root.items.value = items
+                win.tick(0)
+                # Inserting, removing, or moving buttons resets the cached chain.
+                self.assertIsNone(win.chain)
+                interactive = root.find_all(interactive=True)
+                self.assertEqual(tabbed(win), interactive)
+                labels = [button.subviews[0].text for button in interactive]
+                self.assertEqual(labels, [str(item) for item in items])
+
+        self.run_window(test, Buttons)
+
+    def test_lazy_viewport(self):
+        def rows(win, scroll):
+            built = scroll.subviews[0].subviews
+            visible = scroll.frame - scroll.env.padding - scroll.env.border
+            # The built rows cover everything visible.
+            self.assertLessEqual(built[0].frame.top, visible.top)
+            self.assertGreaterEqual(built[-1].frame.bottom, visible.bottom)
+            indexes = [view.index for view in built]
+            win.layout(force=True)
+            self.assertEqual(indexes, [view.index for view in built])
+            return indexes
+
+        def test(win, root):
+            scroll = root.subviews[0].subviews[1]
+            win.tick(0)
+            first = rows(win, scroll)
+            scroll.set_position(Axis.VERTICAL, 5000)
+            scroll.reposition(scroll.frame)
+            win.tick(0)
+            self.assertGreater(rows(win, scroll)[0], first[-1])
+
+        self.run_window(test, LongList, width=400, height=600)
+
+
 if __name__ == "__main__":
     Font.initialize(1.0)
     unittest.main()